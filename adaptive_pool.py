@@ -0,0 +1,153 @@
+# adaptive_pool.py
+# IMG MAPON - Memory-aware admission control for batch workers
+# Author: ICITIFY TECH
+
+import os
+import threading
+from io import BytesIO
+
+MB = 1024 * 1024
+
+# Prior memory cost per analyzer: (fixed bytes, bytes per pixel).
+# KMeans works on a float64 copy plus per-cluster distances; edges become a
+# Python list of lists; YOLO letterboxes to 640px so its cost is mostly fixed;
+# tesseract runs out of process but we hold the PIL copy.
+ANALYZER_COSTS = {
+    "metadata": (2 * MB, 0.0),
+    "colors": (8 * MB, 72.0),
+    "edges": (4 * MB, 14.0),
+    "text": (16 * MB, 4.0),
+    "objects": (96 * MB, 3.0),
+    "forensics": (8 * MB, 12.0),
+    "color_index": (2 * MB, 1.0),
+}
+# Decoding itself (BGR + RGB copies)
+DECODE_BYTES_PER_PIXEL = 6.0
+
+
+def image_pixels(data):
+    """Pixel count read from the image header only (no decode); 0 if unknown."""
+    try:
+        from PIL import Image
+        src = BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        with Image.open(src) as img:
+            w, h = img.size
+        return w * h
+    except Exception:
+        return 0
+
+
+class MemoryBudget:
+    """
+    Decides how many batch items may run at once from available memory.
+
+    Each item gets an estimated cost (pixel count x enabled analyzers, plus
+    its in-memory payload). An item is admitted while the sum of in-flight
+    estimates fits in available memory minus a reserve, so concurrency grows
+    on small images and shrinks on a burst of large ones. A sampler thread
+    records the process's peak RSS while each item runs; the ratio of
+    observed to estimated cost corrects future estimates.
+    """
+
+    def __init__(self, analyzers, max_workers=None, reserve_fraction=0.15,
+                 sample_interval=0.05):
+        import psutil  # required for adaptive mode (listed in requirements.txt)
+
+        self.psutil = psutil
+        self.process = psutil.Process()
+        self.analyzers = [a for a in analyzers if a in ANALYZER_COSTS]
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.reserve_fraction = reserve_fraction
+        self.correction = 1.0
+        self._lock = threading.Lock()
+        self._tasks = {}  # token -> [estimate, rss_at_start, peak_rss, correction]
+        self._next_token = 0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, args=(sample_interval,),
+                                         daemon=True)
+        self._sampler.start()
+
+    def close(self):
+        self._stop.set()
+
+    # ---------------------------
+    # Estimation / admission
+    # ---------------------------
+
+    def estimate(self, data):
+        pixels = image_pixels(data)
+        fixed = sum(ANALYZER_COSTS[a][0] for a in self.analyzers)
+        per_pixel = DECODE_BYTES_PER_PIXEL + sum(ANALYZER_COSTS[a][1] for a in self.analyzers)
+        payload = len(data) if isinstance(data, (bytes, bytearray, memoryview)) else 0
+        return int((fixed + per_pixel * pixels) * self.correction) + payload
+
+    def available(self):
+        vm = self.psutil.virtual_memory()
+        return vm.available - vm.total * self.reserve_fraction
+
+    def admit(self, estimate):
+        """True if a task of `estimate` bytes may start now."""
+        with self._lock:
+            running = len(self._tasks)
+            committed = sum(t[0] for t in self._tasks.values())
+        if running == 0:
+            return True  # always make progress, even on a huge image
+        if running >= self.max_workers:
+            return False
+        # Memory already used by running tasks is reflected in available();
+        # only their not-yet-reached estimated peak is still outstanding
+        with self._lock:
+            grown = sum(max(0, t[2] - t[1]) for t in self._tasks.values())
+        return estimate + max(0, committed - grown) <= self.available()
+
+    # ---------------------------
+    # Tracking
+    # ---------------------------
+
+    def started(self, estimate):
+        rss = self.process.memory_info().rss
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            self._tasks[token] = [estimate, rss, rss, self.correction]
+        return token
+
+    def finished(self, token):
+        """Fold the task's observed peak into the correction factor."""
+        with self._lock:
+            estimate, start_rss, peak, correction = self._tasks.pop(token)
+            overlapping = sum(t[0] for t in self._tasks.values()) + estimate
+        if estimate <= 0:
+            return
+        # With concurrent tasks the growth is shared: attribute it by estimate
+        observed = max(0, peak - start_rss) * (estimate / float(overlapping))
+        if observed > 0:
+            # Compare against the uncorrected prior so the factor converges
+            ratio = min(8.0, max(0.25, observed * correction / float(estimate)))
+            self.correction = min(8.0, max(0.25, 0.8 * self.correction + 0.2 * ratio))
+
+    def _sample(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                rss = self.process.memory_info().rss
+            except Exception:
+                continue
+            with self._lock:
+                for task in self._tasks.values():
+                    if rss > task[2]:
+                        task[2] = rss
+
+    def stats(self):
+        with self._lock:
+            running = len(self._tasks)
+        return {"running": running, "correction": round(self.correction, 3),
+                "available_mb": int(self.available() / MB)}
+
+
+def enabled_analyzers(args):
+    """Analyzer names from parsed CLI flags, for the cost model."""
+    names = [flag for flag in ("metadata", "colors", "edges", "text", "objects", "forensics")
+             if getattr(args, flag, False)]
+    if getattr(args, "color_index", None):
+        names.append("color_index")
+    return names
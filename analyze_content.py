@@ -2,12 +2,13 @@
 # IMG MAPON - Image analysis utilities (Production)
 # Author: ICITIFY TECH
 
+import threading
+from io import BytesIO
 from PIL import Image, ExifTags
 import cv2
 import numpy as np
 from sklearn.cluster import KMeans
 import pytesseract
-import torch
 
 # Predefined COCO classes for object detection
 CLASSES = [
@@ -26,14 +27,111 @@ CLASSES = [
     "scissors", "teddy bear", "hair drier", "toothbrush"
 ]
 
+# ---------------------------
+# Image loading
+# ---------------------------
+# Every analyzer accepts a file path, the encoded image bytes (e.g. an
+# archive member read straight into memory), a PIL image, or a NumPy array
+# in PIL channel order (HxWx3 RGB, HxWx4 RGBA or HxW grayscale).
+
+
+def _is_buffer(image):
+    return isinstance(image, (bytes, bytearray, memoryview))
+
+
+def _is_decoded(image):
+    return isinstance(image, (Image.Image, np.ndarray))
+
+
+def open_pil(image):
+    if _is_buffer(image):
+        return Image.open(BytesIO(image))
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    return Image.open(image)
+
+
+def _array_to_cv2(arr, flags):
+    """PIL-ordered pixels -> what cv2.imread(..., flags) would return."""
+    arr = np.asarray(arr)
+    if arr.dtype != np.uint8:
+        arr = np.clip(arr, 0, 255).astype(np.uint8)
+    if flags in (cv2.IMREAD_GRAYSCALE, cv2.IMREAD_REDUCED_GRAYSCALE_4):
+        if arr.ndim == 3:
+            code = cv2.COLOR_RGBA2GRAY if arr.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+            arr = cv2.cvtColor(arr, code)
+    elif arr.ndim == 2:
+        arr = cv2.cvtColor(arr, cv2.COLOR_GRAY2BGR)
+    else:
+        code = cv2.COLOR_RGBA2BGR if arr.shape[2] == 4 else cv2.COLOR_RGB2BGR
+        arr = cv2.cvtColor(arr, code)
+    if flags in (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4):
+        h, w = arr.shape[:2]
+        arr = cv2.resize(arr, (max(1, w // 4), max(1, h // 4)), interpolation=cv2.INTER_AREA)
+    return arr
+
+
+def read_cv2(image, flags=cv2.IMREAD_COLOR):
+    if _is_buffer(image):
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flags)
+    if isinstance(image, Image.Image):
+        mode = "L" if image.mode in ("L", "I", "I;16") else "RGB"
+        return _array_to_cv2(np.asarray(image.convert(mode)), flags)
+    if isinstance(image, np.ndarray):
+        return _array_to_cv2(image, flags)
+    return cv2.imread(image, flags)
+
+
+# Optional FeatureCache (see feature_cache.py); when set, decoded pixels are
+# served memory-mapped instead of decoding the image again
+_feature_cache = None
+
+
+def set_feature_cache(cache):
+    global _feature_cache
+    _feature_cache = cache
+
+
+def load_rgb(image):
+    """Decoded RGB pixels (through the feature cache when enabled)."""
+    def _decode():
+        img = read_cv2(image)
+        if _feature_cache is not None:
+            img = _feature_cache.downscale(img)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if _feature_cache is None or _is_decoded(image):
+        return _decode()
+    return _feature_cache.get(image, "rgb", _decode)
+
+
+def load_reduced_rgb(image):
+    """RGB pixels at 1/4 scale; JPEGs are decoded directly at that size."""
+    img = read_cv2(image, cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None:
+        img = read_cv2(image)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def load_gray(image):
+    """Decoded grayscale pixels (through the feature cache when enabled)."""
+    def _decode():
+        img = read_cv2(image, cv2.IMREAD_GRAYSCALE)
+        if _feature_cache is not None:
+            img = _feature_cache.downscale(img)
+        return img
+    if _feature_cache is None or _is_decoded(image):
+        return _decode()
+    return _feature_cache.get(image, "gray", _decode)
+
 # ---------------------------
 # Dominant colors extraction
 # ---------------------------
 
 
 def dominant_colors(image_path, k=5):
-    img = cv2.imread(image_path)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = load_rgb(image_path)
     img_flat = img.reshape((-1, 3))
 
     kmeans = KMeans(n_clusters=k, random_state=42)
@@ -42,14 +140,36 @@ def dominant_colors(image_path, k=5):
 
     return [tuple(color) for color in colors]
 
+# ---------------------------
+# Color signature (compact quantized histogram)
+# ---------------------------
+SIGNATURE_BINS = 8  # per RGB channel -> 512-bin histogram
+
+
+def color_signature(image_path, bins=SIGNATURE_BINS):
+    """
+    L1-normalized RGB histogram with `bins` levels per channel.
+    JPEGs are decoded at 1/4 scale: the histogram does not need full resolution.
+    """
+    img = read_cv2(image_path, cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None:
+        img = read_cv2(image_path)
+    if img is None:
+        raise ValueError("could not decode image")
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    q = (rgb.reshape(-1, 3).astype(np.uint16) * bins) >> 8
+    idx = (q[:, 0] * bins + q[:, 1]) * bins + q[:, 2]
+    hist = np.bincount(idx, minlength=bins ** 3).astype(np.float32)
+    return hist / max(hist.sum(), 1.0)
+
 # ---------------------------
 # Edge detection
 # ---------------------------
 
 
-def detect_edges(image_path):
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    edges = cv2.Canny(img, 100, 200)
+def detect_edges(image_path, low=100, high=200):
+    img = load_gray(image_path)
+    edges = cv2.Canny(np.asarray(img), low, high)
     return edges.tolist()  # JSON-friendly
 
 # ---------------------------
@@ -57,20 +177,34 @@ def detect_edges(image_path):
 # ---------------------------
 
 
-def extract_text(image_path):
-    img = Image.open(image_path)
-    text = pytesseract.image_to_string(img)
+def extract_text(image_path, timeout=0):
+    # tesseract runs as a subprocess; pytesseract kills it after `timeout` seconds
+    img = open_pil(image_path)
+    text = pytesseract.image_to_string(img, timeout=timeout)
     return text.strip()
 
 
 # ---------------------------
 # Object detection using YOLOv5
 # ---------------------------
-# Load model once for production
-yolo_model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True)
+# Loaded once, on first use (importing this module must stay cheap and offline)
+_yolo_model = None
+_yolo_lock = threading.Lock()
+
+
+def get_yolo_model():
+    global _yolo_model
+    with _yolo_lock:
+        if _yolo_model is None:
+            import torch
+            _yolo_model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True)
+    return _yolo_model
 
 
 def detect_objects(image_path):
+    yolo_model = get_yolo_model()
+    if _is_buffer(image_path) or _is_decoded(image_path):
+        image_path = open_pil(image_path).convert("RGB")
     results = yolo_model(image_path)
     objects = []
     for *box, conf, cls in results.xyxy[0]:
@@ -87,7 +221,7 @@ def detect_objects(image_path):
 
 
 def image_info(image_path):
-    img = Image.open(image_path)
+    img = open_pil(image_path)
     info = {
         "format": img.format,
         "mode": img.mode,
@@ -0,0 +1,106 @@
+# archive_input.py
+# IMG MAPON - Read images straight out of ZIP/TAR archives (no extraction)
+# Author: ICITIFY TECH
+
+import os
+import tarfile
+import zipfile
+
+from batch import IMAGE_EXTENSIONS, SkippedItem
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2",
+                    ".tar.xz", ".txz")
+# Separator between archive path and member path in item ids ("dump.zip!DCIM/1.jpg")
+MEMBER_SEP = "!"
+# Members larger than this are skipped (guards against decompression bombs)
+MAX_MEMBER_BYTES = 512 * 1024 * 1024
+
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def member_id(archive_path, member_name):
+    return f"{archive_path}{MEMBER_SEP}{member_name}"
+
+
+def split_member_id(item):
+    """
+    Return (archive_path, member_name) for an item id, or (item, None).
+    Archive path and member name may both contain the separator: the split
+    is at the first one that ends an existing archive file.
+    """
+    start = 0
+    while True:
+        pos = item.find(MEMBER_SEP, start)
+        if pos < 0:
+            return item, None
+        if is_archive(item[:pos]):
+            return item[:pos], item[pos + len(MEMBER_SEP):]
+        start = pos + 1
+
+
+def _is_image_name(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def has_index(archive_path):
+    """ZIP files list their members in a central directory; TAR files do not."""
+    return archive_path.lower().endswith(".zip")
+
+
+def list_archive_images(archive_path):
+    """
+    Item ids of every image member in the archive.
+    ZIP reads only the central directory. TAR has no index: listing it reads
+    (and for .tar.gz etc. decompresses) the whole archive, so batch runs
+    register TAR members while streaming them instead (see batch.run_batch).
+    """
+    if archive_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as zf:
+            names = [i.filename for i in zf.infolist()
+                     if not i.is_dir() and _is_image_name(i.filename)]
+    else:
+        with tarfile.open(archive_path, "r|*") as tf:
+            names = [m.name for m in tf if m.isfile() and _is_image_name(m.name)]
+    return [member_id(archive_path, name) for name in names]
+
+
+def iter_archive_members(archive_path, wanted=None, max_bytes=MAX_MEMBER_BYTES):
+    """
+    Yield (item_id, image_bytes) for image members, in archive order;
+    oversized members yield a SkippedItem instead of bytes so the batch
+    records them as failed.
+
+    Only one member is held in memory at a time per yielded item. TAR files
+    (including .tar.gz) are read in streaming mode, one decompression pass
+    per call. `wanted` restricts output to a set of item ids (e.g. what a
+    resumed batch still has to do); None yields every image member.
+    """
+    if archive_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not _is_image_name(info.filename):
+                    continue
+                item = member_id(archive_path, info.filename)
+                if wanted is not None and item not in wanted:
+                    continue
+                if info.file_size > max_bytes:
+                    yield item, SkippedItem(f"member larger than {max_bytes} bytes")
+                    continue
+                with zf.open(info) as f:
+                    yield item, f.read()
+    else:
+        with tarfile.open(archive_path, "r|*") as tf:
+            for member in tf:
+                if not member.isfile() or not _is_image_name(member.name):
+                    continue
+                item = member_id(archive_path, member.name)
+                if wanted is not None and item not in wanted:
+                    continue
+                if member.size > max_bytes:
+                    yield item, SkippedItem(f"member larger than {max_bytes} bytes")
+                    continue
+                f = tf.extractfile(member)
+                if f is not None:
+                    yield item, f.read()
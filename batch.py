@@ -0,0 +1,310 @@
+# batch.py
+# IMG MAPON - Resumable batch runs backed by a checkpoint manifest
+# Author: ICITIFY TECH
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp", ".heic"}
+
+# Item states stored in the manifest
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class SkippedItem(Exception):
+    """Yielded by an item source in place of data it will not provide (too large...)."""
+
+
+def collect_images(input_path):
+    """Return a sorted list of image files under a directory (or the file itself)."""
+    if os.path.isfile(input_path):
+        return [input_path]
+    found = []
+    for root, _dirs, files in os.walk(input_path):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def result_filename(item):
+    """Stable, filesystem-safe result file name for an input item."""
+    digest = hashlib.sha1(item.encode("utf-8")).hexdigest()[:12]
+    base = os.path.splitext(os.path.basename(item))[0][:60] or "item"
+    return f"{base}_{digest}.json"
+
+
+class Manifest:
+    """
+    Durable record of input -> status/result pointer for a batch job.
+
+    Every state change is committed immediately (SQLite WAL), so a job that
+    is killed mid-run loses at most the item it was working on.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                item        TEXT PRIMARY KEY,
+                status      TEXT NOT NULL,
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                result_path TEXT,
+                error       TEXT,
+                duration    REAL,
+                updated_at  REAL
+            )""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_items_status ON items(status)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, items):
+        """Register items; already known items keep their status."""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO items (item, status, updated_at) VALUES (?, ?, ?)",
+                [(item, PENDING, now) for item in items])
+
+    def recover(self):
+        """Items left 'running' by a crashed run go back to the queue."""
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE items SET status=? WHERE status=?", (PENDING, RUNNING))
+        return cur.rowcount
+
+    def todo(self, max_attempts):
+        """Pending items plus failed ones that still have retries left."""
+        rows = self.conn.execute(
+            "SELECT item FROM items WHERE status=? OR (status=? AND attempts<?) "
+            "ORDER BY item", (PENDING, FAILED, max_attempts))
+        return [row[0] for row in rows]
+
+    def runnable(self, item, max_attempts):
+        """Whether `item` is pending or failed with retries left."""
+        row = self.conn.execute(
+            "SELECT status, attempts FROM items WHERE item=?", (item,)).fetchone()
+        return bool(row) and (row[0] == PENDING or (row[0] == FAILED and row[1] < max_attempts))
+
+    def start(self, item):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE items SET status=?, attempts=attempts+1, updated_at=? WHERE item=?",
+                (RUNNING, time.time(), item))
+
+    def finish(self, item, result_path, duration):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE items SET status=?, result_path=?, error=NULL, duration=?, "
+                "updated_at=? WHERE item=?",
+                (DONE, result_path, duration, time.time(), item))
+
+    def fail(self, item, error, duration):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE items SET status=?, error=?, duration=?, updated_at=? WHERE item=?",
+                (FAILED, str(error)[:1000], duration, time.time(), item))
+
+    def counts(self):
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status")
+        return dict(rows.fetchall())
+
+    def result_path(self, item):
+        row = self.conn.execute(
+            "SELECT result_path FROM items WHERE item=?", (item,)).fetchone()
+        return row[0] if row else None
+
+
+def _format_eta(seconds):
+    seconds = int(max(0, seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h:d}:{m:02d}:{s:02d}"
+
+
+def _progress(status, done, total, item, t0, started):
+    """One progress line; `total` is None while items are still being discovered."""
+    took = time.time() - t0
+    if total is None:
+        return f"{status} [{done}] {item} ({took:.1f}s)"
+    eta = (time.time() - started) / done * (total - done)
+    return f"{status} [{done}/{total}] {item} ({took:.1f}s, ETA {_format_eta(eta)})"
+
+
+def _discovered(source, manifest, max_attempts):
+    """
+    Register items in the manifest as the source yields them and pass on
+    those still to do (for inputs that cannot be listed without reading
+    them through, such as compressed TAR streams).
+    """
+    for item, data in source:
+        manifest.add([item])
+        if manifest.runnable(item, max_attempts):
+            yield item, data
+
+
+def _read_paths(todo):
+    """Default item source: the item is a file path and is passed as-is."""
+    for item in todo:
+        yield item, item
+
+
+def save_result(item, result, results_dir):
+    """Write one item's result JSON into results_dir; returns its path."""
+    out_path = os.path.join(results_dir, result_filename(item))
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result, f, indent=4, default=str)
+    os.replace(tmp_path, out_path)  # atomic: never leave half-written results
+    return out_path
+
+
+def _skip(manifest, item, reason):
+    manifest.start(item)
+    manifest.fail(item, f"skipped: {reason}", 0.0)
+    print(f"❌ {item}: skipped ({reason})")
+
+
+def _run_round(todo, manifest, process_func, results_dir, workers=1, open_items=None,
+               budget=None):
+    """
+    Process one pass over `todo`, checkpointing and printing progress/ETA.
+
+    Items are read by `open_items(todo)` (default: paths as-is) and analyzed on
+    up to `workers` threads. At most 2 x workers items are read ahead, so
+    in-memory payloads (archive members) stay bounded. With a MemoryBudget
+    (adaptive_pool.py) the budget decides instead how many items run at once.
+    Manifest and result writes happen on this thread only.
+    `todo` is None when `open_items` discovers the items itself.
+    """
+    started = time.time()
+    done = 0
+    total = len(todo) if todo is not None else None
+    in_flight = {}
+    if budget is not None:
+        workers = budget.max_workers
+
+    def _collect(futures):
+        nonlocal done
+        for future in futures:
+            item, t0, token = in_flight.pop(future)
+            if token is not None:
+                budget.finished(token)
+            try:
+                out_path = save_result(item, future.result(), results_dir)
+                manifest.finish(item, out_path, time.time() - t0)
+                status = "✅"
+            except Exception as e:
+                manifest.fail(item, f"{type(e).__name__}: {e}", time.time() - t0)
+                status = "❌"
+            done += 1
+            print(_progress(status, done, total, item, t0, started))
+
+    source = (open_items or _read_paths)(todo)
+    seen = set()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        try:
+            for item, data in source:
+                seen.add(item)
+                if isinstance(data, SkippedItem):
+                    _skip(manifest, item, data)
+                    continue
+                token = None
+                if budget is not None:
+                    estimate = budget.estimate(data)
+                    # Hold the item until enough memory is free (re-check as
+                    # tasks finish or every half second as memory changes)
+                    while not budget.admit(estimate):
+                        finished, _ = wait(list(in_flight), timeout=0.5,
+                                           return_when=FIRST_COMPLETED)
+                        _collect(finished)
+                    token = budget.started(estimate)
+                manifest.start(item)
+                future = pool.submit(process_func, item, data)
+                in_flight[future] = (item, time.time(), token)
+                if budget is None and len(in_flight) >= 2 * max(1, workers):
+                    finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    _collect(finished)
+        finally:
+            _collect(list(in_flight))
+
+    # Items the source never produced (missing or skipped) count as attempts too
+    for item in todo or ():
+        if item not in seen:
+            manifest.start(item)
+            manifest.fail(item, "item could not be read from input", 0.0)
+
+
+def run_batch(items, process_func, manifest_path, results_dir, max_attempts=3,
+              workers=1, open_items=None, budget=None, pool=None):
+    """
+    Process `items` with `process_func(item, data) -> dict`, checkpointing each one.
+    `data` is whatever `open_items` yields for the item (by default the item itself).
+    With `items=None` the first round reads everything `open_items(None)`
+    yields and registers items as they stream past, so an input that has no
+    index is read once; only retries read it again.
+    With a SharedProcessPool (shared_pool.py) the items run on its worker
+    processes instead of `workers` threads.
+
+    - Completed items (from this or an earlier run) are skipped.
+    - Failed items are retried until they reach `max_attempts`.
+    - Each result is written to `results_dir` and the manifest stores its path.
+    Returns the manifest status counts.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    manifest = Manifest(manifest_path)
+    try:
+        if items is not None:
+            manifest.add(items)
+        recovered = manifest.recover()
+        if recovered:
+            print(f"♻️ Recovered {recovered} interrupted item(s) from previous run.")
+
+        counts = manifest.counts()
+        round_no = 0
+        if items is None:
+            round_no = 1
+            print(f"📦 Batch: streaming items from the input, {counts.get(DONE, 0)} already "
+                  f"done (manifest: {manifest_path})")
+            stream = lambda _todo: _discovered(open_items(None), manifest, max_attempts)
+            if pool is not None:
+                pool.run_round(None, manifest, results_dir, open_items=stream)
+            else:
+                _run_round(None, manifest, process_func, results_dir,
+                           workers=workers, open_items=stream, budget=budget)
+        while True:
+            todo = manifest.todo(max_attempts)
+            if not todo:
+                break
+            round_no += 1
+            if round_no == 1:
+                print(f"📦 Batch: {len(todo)} to process, {counts.get(DONE, 0)} already done "
+                      f"(manifest: {manifest_path})")
+            else:
+                print(f"🔁 Retrying {len(todo)} failed item(s)...")
+            if pool is not None:
+                pool.run_round(todo, manifest, results_dir, open_items=open_items)
+            else:
+                _run_round(todo, manifest, process_func, results_dir,
+                           workers=workers, open_items=open_items, budget=budget)
+            if budget is not None:
+                stats = budget.stats()
+                print(f"🧮 Memory model correction x{stats['correction']}, "
+                      f"{stats['available_mb']} MB available")
+
+        return manifest.counts()
+    finally:
+        manifest.close()
@@ -0,0 +1,253 @@
+# color_index.py
+# IMG MAPON - Search-by-palette index over per-image color signatures
+# Author: ICITIFY TECH
+
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: thread lock only
+    fcntl = None
+
+DEFAULT_INDEX_DIR = "imgmapon_colors"
+# Rows scored per NumPy batch; bounds the float32 working copy to ~128 MB
+QUERY_CHUNK = 65536
+
+_write_lock = threading.Lock()
+
+
+def hex_to_rgb(value):
+    """'#c0392b' / 'c0392b' / '#f00' -> (r, g, b); ValueError otherwise."""
+    digits = value.strip().lstrip("#")
+    if len(digits) == 3:
+        digits = "".join(c * 2 for c in digits)
+    if len(digits) != 6 or any(c not in "0123456789abcdefABCDEF" for c in digits):
+        raise ValueError(f"Expected a #RRGGBB color, got {value!r}")
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+class ColorIndex:
+    """
+    Append-only on-disk index of color signatures.
+
+    Layout of the index directory:
+      signatures.u8  - raw uint8 rows of sqrt(histogram) * 255, one per image
+      keys.txt       - image key per row (same order)
+      meta.json      - signature shape (bins per channel)
+
+    Rows hold sqrt(h): they have unit L2 norm, so the Hellinger similarity
+    of every image to a query is a single matrix-vector product, and the
+    histogram itself is just the row squared. uint8 keeps a row at 512 bytes
+    and converts to float far faster than float16. Re-indexed keys are appended;
+    the newest row wins at query time.
+    """
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, bins=None):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self.sig_path = os.path.join(index_dir, "signatures.u8")
+        self.keys_path = os.path.join(index_dir, "keys.txt")
+        meta_path = os.path.join(index_dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.bins = json.load(f)["bins"]
+            if bins and bins != self.bins:
+                raise ValueError(f"Index uses {self.bins} bins per channel, not {bins}")
+        else:
+            if not bins:
+                from analyze_content import SIGNATURE_BINS
+                bins = SIGNATURE_BINS
+            self.bins = bins
+            with open(meta_path, "w") as f:
+                json.dump({"bins": self.bins}, f)
+        self.dim = self.bins ** 3
+        # (bytes of keys.txt already counted, complete key lines in them)
+        self._keys_scanned = (0, 0)
+
+    # ---------------------------
+    # Writing
+    # ---------------------------
+
+    def _repair(self, sig_file, keys_file):
+        """
+        Called under the file lock before appending: cut whatever a crashed
+        writer left behind (a signature row without its key, half a key
+        line), so row i keeps pairing with key line i. Only the part of
+        keys.txt added since the last call is read.
+        """
+        keys_file.seek(0, os.SEEK_END)
+        size = keys_file.tell()
+        offset, count = self._keys_scanned
+        if size < offset:
+            offset, count = 0, 0  # shrunk under us: rescan
+        keys_file.seek(offset)
+        tail = keys_file.read()
+        count += tail.count(b"\n")
+        complete = offset + tail.rfind(b"\n") + 1
+        if complete < size:
+            keys_file.truncate(complete)
+        self._keys_scanned = (complete, count)
+        sig_file.seek(0, os.SEEK_END)
+        if sig_file.tell() > count * self.dim:
+            sig_file.truncate(count * self.dim)
+        return count
+
+    def add(self, key, signature):
+        """Append one image's signature (an L1-normalized histogram)."""
+        sig = np.asarray(signature, dtype=np.float32).reshape(-1)
+        if sig.size != self.dim:
+            raise ValueError(f"Signature has {sig.size} bins, index expects {self.dim}")
+        row = np.clip(np.rint(np.sqrt(sig) * 255.0), 0, 255).astype(np.uint8)
+        line = (key.replace("\n", " ") + "\n").encode("utf-8")
+        with _write_lock, open(self.sig_path, "ab") as f, open(self.keys_path, "a+b") as k:
+            # Batch worker processes append too: hold a file lock so rows
+            # and keys stay in the same order
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            count = self._repair(f, k)
+            # Signatures first: a crash between the writes leaves an orphan
+            # row, never a key without a signature. load() ignores the
+            # orphan and the next add() truncates it (see _repair)
+            f.write(row.tobytes())
+            f.flush()
+            k.write(line)
+            k.flush()
+            self._keys_scanned = (self._keys_scanned[0] + len(line), count + 1)
+
+    # ---------------------------
+    # Querying
+    # ---------------------------
+
+    def load(self):
+        """(keys, memmap of sqrt-histograms) with duplicate keys resolved to the newest row."""
+        if not os.path.exists(self.keys_path):
+            return [], np.zeros((0, self.dim), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+        with open(self.keys_path, encoding="utf-8") as f:
+            keys = f.read().splitlines()
+        rows = min(len(keys), os.path.getsize(self.sig_path) // self.dim)
+        keys = keys[:rows]
+        if not rows:
+            return [], np.zeros((0, self.dim), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+        sigs = np.memmap(self.sig_path, dtype=np.uint8, mode="r", shape=(rows, self.dim))
+        latest = {}
+        for i, key in enumerate(keys):
+            latest[key] = i
+        live = np.fromiter(sorted(latest.values()), dtype=np.int64, count=len(latest))
+        return keys, sigs, live
+
+    def _score(self, weights, squared):
+        """Score every live row against `weights`, chunk by chunk."""
+        keys, sigs, live = self.load()
+        scores = np.empty(len(live), dtype=np.float32)
+        contiguous = len(live) == len(sigs)  # no re-indexed keys: plain slices
+        for start in range(0, len(live), QUERY_CHUNK):
+            if contiguous:
+                chunk = sigs[start:start + QUERY_CHUNK]
+            else:
+                chunk = sigs[live[start:start + QUERY_CHUNK]]
+            rows = np.asarray(chunk, dtype=np.float32)
+            rows *= 1.0 / 255.0
+            if squared:
+                rows *= rows  # back to the histogram
+            scores[start:start + QUERY_CHUNK] = rows @ weights
+        return keys, live, scores
+
+    @staticmethod
+    def _top(keys, live, scores, top):
+        if not len(scores):
+            return []
+        top = min(top, len(scores))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(keys[live[i]], float(scores[i])) for i in best]
+
+    def similar(self, signature, top=20):
+        """
+        Images whose palette is closest to `signature` (Hellinger similarity,
+        1.0 = identical color distribution).
+        """
+        q = np.sqrt(np.asarray(signature, dtype=np.float32).reshape(-1))
+        keys, live, scores = self._score(q, squared=False)
+        return self._top(keys, live, scores, top)
+
+    def bin_centers(self):
+        step = 256.0 / self.bins
+        levels = (np.arange(self.bins) + 0.5) * step
+        r, g, b = np.meshgrid(levels, levels, levels, indexing="ij")
+        return np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+
+    def dominated_by(self, rgb, top=20, radius=48.0):
+        """
+        Images with the largest share of pixels near `rgb`: each bin is
+        weighted by a Gaussian of its center's distance to the color.
+        Scores are approximately the fraction of matching pixels.
+        """
+        d2 = ((self.bin_centers() - np.asarray(rgb, dtype=np.float64)) ** 2).sum(axis=1)
+        weights = np.exp(-d2 / (2.0 * radius ** 2)).astype(np.float32)
+        keys, live, scores = self._score(weights, squared=True)
+        return self._top(keys, live, scores, top)
+
+    def count(self):
+        return len(self.load()[2])
+
+
+# One index object per directory; batch threads share it
+_indexes = {}
+
+
+def index_signature(index_dir, key, signature):
+    with _write_lock:
+        index = _indexes.get(index_dir)
+        if index is None:
+            index = _indexes[index_dir] = ColorIndex(index_dir)
+    index.add(key, signature)
+
+# ---------------------------
+# `main.py palette` subcommand
+# ---------------------------
+
+
+def palette_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="main.py palette", description="Search the IMG MAPON color index")
+    parser.add_argument('--index', type=str, default=DEFAULT_INDEX_DIR,
+                        help="Color index directory")
+    parser.add_argument('--like', type=str, help="Find images with a palette close to this image")
+    parser.add_argument('--color', type=str, help="Find images dominated by this color (#RRGGBB)")
+    parser.add_argument('--radius', type=float, default=48.0,
+                        help="RGB distance that still counts as --color")
+    parser.add_argument('--top', type=int, default=20, help="Number of results")
+    args = parser.parse_args(argv)
+
+    if not args.like and not args.color:
+        parser.error("give --like IMAGE or --color #RRGGBB")
+    if args.color:
+        try:
+            color = hex_to_rgb(args.color)
+        except ValueError as e:
+            parser.error(str(e))
+    if not os.path.exists(os.path.join(args.index, "meta.json")):
+        print(f"❌ Color index not found: {args.index}")
+        return []
+
+    index = ColorIndex(args.index)
+    if args.like:
+        from analyze_content import color_signature
+        try:
+            signature = color_signature(args.like)
+        except Exception as e:
+            print(f"❌ Could not read image {args.like}: {e}")
+            return []
+        matches = index.similar(signature, top=args.top)
+    else:
+        matches = index.dominated_by(color, top=args.top, radius=args.radius)
+
+    for key, score in matches:
+        print(f"🎨 {score:.3f}  {key}")
+    print(f"\n🔎 {len(matches)} result(s) from {index.count()} indexed image(s)")
+    return matches
@@ -0,0 +1,168 @@
+# download_cache.py
+# IMG MAPON - On-disk HTTP download cache with ETag/Last-Modified revalidation
+# Author: ICITIFY TECH
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from email.utils import parsedate_to_datetime
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "IMGMAPON_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "imgmapon", "downloads"))
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+
+
+def parse_cache_control(value):
+    """'max-age=60, no-cache' -> {'max-age': '60', 'no-cache': True}"""
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip()] = arg.strip().strip('"') if arg else True
+    return directives
+
+
+def freshness_deadline(headers, now=None):
+    """
+    Absolute time until which a response may be reused without revalidation
+    (0 = always revalidate). Follows Cache-Control max-age, then Expires.
+    """
+    now = now or time.time()
+    cc = parse_cache_control(headers.get("Cache-Control"))
+    if "no-cache" in cc:
+        return 0
+    if "max-age" in cc:
+        try:
+            age = int(headers.get("Age", 0) or 0)
+            return now + max(0, int(cc["max-age"]) - age)
+        except ValueError:
+            return 0
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except Exception:
+            return 0
+    return 0
+
+
+class DownloadCache:
+    """
+    Response bodies stored by URL hash, next to a small JSON record of their
+    validators (ETag / Last-Modified) and freshness. Least recently used
+    entries are evicted once the bodies exceed `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".body", base + ".json"
+
+    def lookup(self, url):
+        """Cached record for url (with 'body' path), or None."""
+        body, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(body) or meta.get("url") != url:
+            return None
+        meta["body"] = body
+        return meta
+
+    @staticmethod
+    def is_fresh(meta):
+        return bool(meta) and meta.get("fresh_until", 0) > time.time()
+
+    @staticmethod
+    def conditional_headers(meta):
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def _write_meta(self, url, meta):
+        _, meta_path = self._paths(url)
+        record = {k: v for k, v in meta.items() if k != "body"}
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp, meta_path)
+
+    def store(self, url, headers, source_path):
+        """Cache the body at source_path for url (unless the response forbids it)."""
+        cc = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in cc:
+            return None
+        body, _ = self._paths(url)
+        tmp = body + ".tmp"
+        shutil.copyfile(source_path, tmp)
+        os.replace(tmp, body)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "content_type": headers.get("Content-Type"),
+            "fresh_until": freshness_deadline(headers),
+            "stored_at": time.time(),
+            "size": os.path.getsize(body),
+        }
+        self._write_meta(url, meta)
+        self.evict()
+        return body
+
+    def refresh(self, url, meta, headers):
+        """Record a 304 revalidation: new freshness, possibly new validators."""
+        meta = dict(meta)
+        meta["fresh_until"] = freshness_deadline(headers)
+        if headers.get("ETag"):
+            meta["etag"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            meta["last_modified"] = headers["Last-Modified"]
+        self._write_meta(url, meta)
+        return meta
+
+    def materialize(self, meta, save_path):
+        """Copy a cached body to save_path and mark the entry as recently used."""
+        shutil.copyfile(meta["body"], save_path)
+        now = time.time()
+        os.utime(meta["body"], (now, now))
+        return save_path
+
+    def evict(self):
+        """Remove least recently used bodies until the cache fits max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not re.fullmatch(r"[0-9a-f]{64}\.body", name):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, path = entries.pop(0)
+            for victim in (path, path[:-len(".body")] + ".json"):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+        return total
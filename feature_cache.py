@@ -0,0 +1,94 @@
+# feature_cache.py
+# IMG MAPON - Memory-mapped cache of decoded pixels keyed by content hash
+# Author: ICITIFY TECH
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+DEFAULT_FEATURE_DIR = "imgmapon_features"
+
+
+def _is_buffer(image):
+    return isinstance(image, (bytes, bytearray, memoryview))
+
+
+class FeatureCache:
+    """
+    Decoded (optionally downscaled) pixel arrays stored as .npy files under
+    the BLAKE2 hash of the encoded image, e.g. <dir>/3f/3f9c..._rgb_1024.npy.
+
+    Cached arrays are opened with np.load(mmap_mode="r"): a parameter sweep
+    re-reads pixels zero-copy from the page cache instead of decoding the
+    JPEG again. Arrays are read-only; analyzers must not modify them in place.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_FEATURE_DIR, max_side=None):
+        self.cache_dir = cache_dir
+        self.max_side = max_side
+        self._hashes = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def content_hash(self, image):
+        """Hash of the encoded bytes; path hashes are memoized per (size, mtime)."""
+        if _is_buffer(image):
+            return hashlib.blake2b(image, digest_size=20).hexdigest()
+        st = os.stat(image)
+        memo_key = (os.path.abspath(image), st.st_size, st.st_mtime_ns)
+        digest = self._hashes.get(memo_key)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=20)
+            with open(image, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(block)
+            digest = h.hexdigest()
+            with self._lock:
+                self._hashes[memo_key] = digest
+        return digest
+
+    def _path(self, digest, variant):
+        suffix = f"_{self.max_side}" if self.max_side else ""
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{variant}{suffix}.npy")
+
+    def get(self, image, variant, compute):
+        """
+        Memory-mapped array for (image, variant); `compute()` builds it on a miss.
+        Writes go to a temp file and are renamed, so concurrent workers never
+        read a half-written array.
+        """
+        path = self._path(self.content_hash(image), variant)
+        if os.path.exists(path):
+            try:
+                return np.load(path, mmap_mode="r")
+            except (OSError, ValueError):
+                pass  # corrupt entry: rebuild below
+
+        array = np.ascontiguousarray(compute())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return array
+        return np.load(path, mmap_mode="r")
+
+    def downscale(self, img):
+        """Shrink so the longest side is at most max_side (no-op if unset)."""
+        if not self.max_side:
+            return img
+        import cv2
+        h, w = img.shape[:2]
+        longest = max(h, w)
+        if longest <= self.max_side:
+            return img
+        scale = self.max_side / float(longest)
+        return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                          interpolation=cv2.INTER_AREA)
@@ -0,0 +1,251 @@
+# forensics.py
+# IMG MAPON - Tamper analysis: error level analysis and copy-move detection
+# Author: ICITIFY TECH
+
+import hashlib
+import os
+import time
+
+import cv2
+import numpy as np
+
+from analyze_content import read_cv2, _is_buffer
+
+DEFAULT_FORENSICS_DIR = "imgmapon_forensics"
+
+# Error level analysis
+ELA_QUALITY = 90
+ELA_BLOCK = 8          # JPEG grid
+ELA_SIGMA = 4.0        # robust z-score above which a block stands out
+
+# Copy-move (block matching)
+CM_MAX_SIDE = 640      # work size; bounds the block count (~300k) and runtime
+CM_BLOCK = 16
+CM_STEP = 1
+CM_GRID = 4            # features: CM_GRID x CM_GRID sub-block means
+CM_NEIGHBORS = 4       # sorted rows compared with their next N rows
+CM_TOLERANCE = 2.0     # max feature difference (grey levels) for a match
+CM_MIN_STD = 6.0       # flat blocks (sky, walls) match everything: ignore them
+CM_MIN_OFFSET = 24     # copies closer than this are just texture
+CM_MIN_PAIRS = 12      # matched blocks that must share one offset
+
+
+def artifact_name(image):
+    """Stable file-name stem for heatmaps of an image (path, bytes or array)."""
+    if isinstance(image, (str, os.PathLike)):
+        path = os.fspath(image)
+        stem = os.path.splitext(os.path.basename(path))[0][:60]
+        return f"{stem}_{hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:10]}"
+    if _is_buffer(image):
+        return "image_" + hashlib.blake2b(image, digest_size=8).hexdigest()
+    arr = np.ascontiguousarray(np.asarray(image))
+    return "image_" + hashlib.blake2b(arr.tobytes(), digest_size=8).hexdigest()
+
+
+def _boxes(mask, cell, scale=1.0, min_cells=2):
+    """Bounding boxes [x1, y1, x2, y2] of connected regions in a cell mask."""
+    count, _labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), 8)
+    boxes = []
+    for x, y, w, h, area in stats[1:count]:
+        if area >= min_cells:
+            boxes.append([int(x * cell * scale), int(y * cell * scale),
+                          int((x + w) * cell * scale), int((y + h) * cell * scale)])
+    return boxes
+
+
+def _save_heatmap(values, base_bgr, path):
+    """Color-map `values` (0-255, any size) over the image and write a PNG."""
+    heat = cv2.resize(values.astype(np.uint8), (base_bgr.shape[1], base_bgr.shape[0]),
+                      interpolation=cv2.INTER_NEAREST)
+    overlay = cv2.addWeighted(base_bgr, 0.5, cv2.applyColorMap(heat, cv2.COLORMAP_JET), 0.5, 0)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    cv2.imwrite(path, overlay)
+    return path
+
+# ---------------------------
+# Error level analysis
+# ---------------------------
+
+
+def error_level(img, quality=ELA_QUALITY):
+    """
+    Re-save as JPEG and measure how much each 8x8 block changes.
+
+    Regions pasted in from another image (or edited after the last save)
+    have a different compression history and re-compress with a different
+    error than their surroundings. Returns the per-block mean error
+    (float32, one value per 8x8 block).
+    """
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG re-encoding failed")
+    resaved = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    diff = cv2.absdiff(img, resaved).max(axis=2)
+    h = diff.shape[0] // ELA_BLOCK * ELA_BLOCK
+    w = diff.shape[1] // ELA_BLOCK * ELA_BLOCK
+    blocks = diff[:h, :w].reshape(h // ELA_BLOCK, ELA_BLOCK, w // ELA_BLOCK, ELA_BLOCK)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def ela_regions(block_error, sigma=ELA_SIGMA):
+    """Blocks whose error is an outlier (median + sigma x MAD) and their boxes."""
+    median = float(np.median(block_error))
+    mad = float(np.median(np.abs(block_error - median))) or 1e-3
+    mask = block_error > median + sigma * 1.4826 * mad
+    # Close small gaps so one edited object yields one box
+    mask = cv2.morphologyEx(mask.astype(np.uint8), cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+    return mask, _boxes(mask, ELA_BLOCK, min_cells=4)
+
+# ---------------------------
+# Copy-move detection
+# ---------------------------
+
+
+def _block_features(gray):
+    """
+    Features of every CM_BLOCK x CM_BLOCK block at CM_STEP stride: the means
+    of its CM_GRID x CM_GRID sub-blocks, all read from one integral image.
+    Returns (features [n, CM_GRID**2], std [n], top-left ys, xs).
+    """
+    g = gray.astype(np.float64)
+    integral = cv2.integral(g)
+    integral_sq = cv2.integral(g * g)
+    h, w = gray.shape
+    ys = np.arange(0, h - CM_BLOCK + 1, CM_STEP)
+    xs = np.arange(0, w - CM_BLOCK + 1, CM_STEP)
+    yy, xx = np.meshgrid(ys, xs, indexing="ij")
+    yy, xx = yy.ravel(), xx.ravel()
+
+    def _box_sum(table, y0, x0, size):
+        return (table[y0 + size, x0 + size] - table[y0, x0 + size]
+                - table[y0 + size, x0] + table[y0, x0])
+
+    sub = CM_BLOCK // CM_GRID
+    feats = np.empty((len(yy), CM_GRID * CM_GRID), dtype=np.float32)
+    for i in range(CM_GRID):
+        for j in range(CM_GRID):
+            feats[:, i * CM_GRID + j] = _box_sum(integral, yy + i * sub, xx + j * sub, sub) / (sub * sub)
+    area = float(CM_BLOCK * CM_BLOCK)
+    mean = _box_sum(integral, yy, xx, CM_BLOCK) / area
+    var = _box_sum(integral_sq, yy, xx, CM_BLOCK) / area - mean * mean
+    return feats, np.sqrt(np.maximum(var, 0)), yy, xx
+
+
+def copy_move(gray):
+    """
+    Detect duplicated regions in a grayscale image.
+
+    Blocks are sorted lexicographically by feature vector, so similar blocks
+    end up next to each other and only each row's next CM_NEIGHBORS rows are
+    compared (O(n log n), not O(n^2)). A real copy moves many blocks by the
+    same offset: matched pairs are grouped by offset and offsets with at
+    least CM_MIN_PAIRS pairs are reported.
+    Returns (list of regions, match mask covering the matched blocks).
+    """
+    feats, std, yy, xx = _block_features(gray)
+    keep = std >= CM_MIN_STD
+    feats, yy, xx = feats[keep], yy[keep], xx[keep]
+    mask = np.zeros(gray.shape, dtype=np.uint8)
+    if len(feats) < 2:
+        return [], mask
+
+    order = np.lexsort(np.round(feats).T[::-1])
+    feats, yy, xx = feats[order], yy[order], xx[order]
+
+    a_idx, b_idx = [], []
+    for shift in range(1, min(CM_NEIGHBORS, len(feats) - 1) + 1):
+        close = np.abs(feats[shift:] - feats[:-shift]).max(axis=1) <= CM_TOLERANCE
+        a = np.nonzero(close)[0]
+        a_idx.append(a)
+        b_idx.append(a + shift)
+    a = np.concatenate(a_idx)
+    b = np.concatenate(b_idx)
+    dy, dx = yy[b] - yy[a], xx[b] - xx[a]
+    # Canonical direction so A->B and B->A vote for the same offset
+    flip = (dy < 0) | ((dy == 0) & (dx < 0))
+    a, b = np.where(flip, b, a), np.where(flip, a, b)
+    dy, dx = yy[b] - yy[a], xx[b] - xx[a]
+    far = dy * dy + dx * dx >= CM_MIN_OFFSET ** 2
+    a, b, dy, dx = a[far], b[far], dy[far], dx[far]
+    if not len(a):
+        return [], mask
+
+    offsets, inverse, counts = np.unique(np.stack([dy, dx], axis=1), axis=0,
+                                         return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    regions = []
+    for k in np.nonzero(counts >= CM_MIN_PAIRS)[0]:
+        sel = inverse == k
+        src_y, src_x = yy[a[sel]], xx[a[sel]]
+        dst_y, dst_x = yy[b[sel]], xx[b[sel]]
+        mask[src_y, src_x] = 1
+        mask[dst_y, dst_x] = 1
+        regions.append({
+            "offset": [int(offsets[k][1]), int(offsets[k][0])],
+            "pairs": int(counts[k]),
+            "source": [int(src_x.min()), int(src_y.min()),
+                       int(src_x.max()) + CM_BLOCK, int(src_y.max()) + CM_BLOCK],
+            "target": [int(dst_x.min()), int(dst_y.min()),
+                       int(dst_x.max()) + CM_BLOCK, int(dst_y.max()) + CM_BLOCK],
+        })
+    regions.sort(key=lambda r: -r["pairs"])
+    # Marks sit on block corners: spread each over its block
+    mask = cv2.dilate(mask, np.ones((CM_BLOCK, CM_BLOCK), np.uint8), anchor=(0, 0))
+    return regions, mask
+
+# ---------------------------
+# Stage entry point
+# ---------------------------
+
+
+def analyze_tampering(image, out_dir=None, copy_move_check=True):
+    """
+    Error level analysis plus (optionally) copy-move detection.
+
+    Returns a JSON-friendly dict with suspicious-region boxes in original
+    image coordinates; with `out_dir`, heatmap PNGs are written there and
+    their paths included. ELA runs at full resolution (resampling would
+    erase the compression traces it looks for); copy-move runs on a copy
+    scaled to CM_MAX_SIDE, which bounds its cost on multi-megapixel images.
+    """
+    started = time.time()
+    img = read_cv2(image)
+    if img is None:
+        raise ValueError("could not decode image")
+    name = artifact_name(image) if out_dir else None
+    result = {}
+
+    block_error = error_level(img)
+    ela_mask, ela_boxes = ela_regions(block_error)
+    result["ela"] = {
+        "quality": ELA_QUALITY,
+        "mean_error": round(float(block_error.mean()), 3),
+        "max_error": round(float(block_error.max()), 3),
+        "suspicious_fraction": round(float(ela_mask.mean()), 4),
+        "suspicious_boxes": ela_boxes,
+    }
+    if out_dir:
+        scaled = np.clip(block_error * (255.0 / max(float(block_error.max()), 1.0)), 0, 255)
+        result["ela"]["heatmap"] = _save_heatmap(
+            scaled, img, os.path.join(out_dir, f"{name}_ela.png"))
+
+    if copy_move_check:
+        h, w = img.shape[:2]
+        scale = min(1.0, CM_MAX_SIDE / float(max(h, w)))
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))),
+                              interpolation=cv2.INTER_AREA)
+        regions, cm_mask = copy_move(gray)
+        back = 1.0 / scale
+        for region in regions:
+            for key in ("source", "target"):
+                region[key] = [int(v * back) for v in region[key]]
+            region["offset"] = [int(v * back) for v in region["offset"]]
+        result["copy_move"] = {"detected": bool(regions), "regions": regions[:20]}
+        if out_dir:
+            result["copy_move"]["heatmap"] = _save_heatmap(
+                cm_mask * 255, img, os.path.join(out_dir, f"{name}_copy_move.png"))
+
+    result["elapsed"] = round(time.time() - started, 3)
+    return result
@@ -0,0 +1,94 @@
+# imgmapon.py
+# IMG MAPON - Library API (no import-time side effects)
+# Author: ICITIFY TECH
+#
+#   import imgmapon
+#   result = imgmapon.analyze(open("photo.jpg", "rb").read(),
+#                             {"metadata": True, "colors": True})
+#
+# Importing this module performs no update checks, network calls or model
+# loading; YOLO is loaded on the first request for object detection.
+
+import argparse
+import os
+
+# Analyzer switches and tuning knobs understood by process_image
+DEFAULT_OPTIONS = {
+    "metadata": True,
+    "colors": False,
+    "edges": False,
+    "text": False,
+    "objects": False,
+    "forensics": False,
+    "search": False,
+    "research": False,
+    "k_colors": 5,
+    "canny_low": 100,
+    "canny_high": 200,
+    "stage_timeout": None,
+    "forensics_dir": None,    # heatmap PNG directory; None writes no files
+    "search_providers": "google",
+    "search_endpoint": None,  # ["google=http://127.0.0.1:8080", ...]
+    "search_cache": None,     # reverse search cache directory; None caches nothing
+    "profile": None,      # "triage" / "standard" / "deep" (profiles.py)
+    "deadline": None,     # per-image budget in seconds
+    "stage_costs": None,  # learned cost table path; None keeps it in memory
+}
+
+
+def _normalize_image(data):
+    """
+    Accept a path, bytes, a binary file-like object, a PIL image or a NumPy
+    array (PIL channel order). File-likes are read once into bytes so the
+    concurrently running analyzers can each decode them; nothing is written
+    to disk.
+    """
+    if isinstance(data, (str, os.PathLike)):
+        return os.fspath(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data)
+    if hasattr(data, "read"):
+        return data.read()
+    try:
+        from PIL import Image
+        if isinstance(data, Image.Image):
+            data.load()  # decode now, not lazily from several threads at once
+            return data
+    except ImportError:
+        pass
+    try:
+        import numpy as np
+        if isinstance(data, np.ndarray):
+            return data
+    except ImportError:
+        pass
+    raise TypeError(f"Unsupported image input: {type(data).__name__}")
+
+
+def build_options(options=None, **overrides):
+    """Merge options into the defaults and return a process_image-ready namespace."""
+    merged = dict(DEFAULT_OPTIONS)
+    merged.update(options or {})
+    merged.update(overrides)
+    unknown = set(merged) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown option(s): {', '.join(sorted(unknown))}")
+    args = argparse.Namespace(**merged)
+    if args.profile:
+        from profiles import apply_profile
+        apply_profile(args, args.profile)
+    return args
+
+
+def analyze(data, options=None, **overrides):
+    """
+    Analyze one image and return the same result dict as process_image
+    (metadata, gps, gps_location, dominant_colors, edges, text, objects,
+    stage_timings, ...).
+
+    `options` is a dict of DEFAULT_OPTIONS keys; keyword arguments override it:
+        analyze(img_bytes, colors=True, objects=True)
+    """
+    from main import process_image  # deferred: keeps `import imgmapon` cheap
+
+    return process_image(_normalize_image(data), build_options(options, **overrides))
@@ -0,0 +1,320 @@
+# job_queue.py
+# IMG MAPON - Shared job queue for coordinator / worker distribution
+# Author: ICITIFY TECH
+
+import json
+import os
+from abc import ABC, abstractmethod
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# Job states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class JobQueue(ABC):
+    """
+    Interface every queue backend implements.
+
+    A job is a batch of image paths. Workers lease a job for `lease_seconds`,
+    renew the lease with heartbeats while working, and push results back.
+    A job whose lease expires (dead worker) is handed to the next worker.
+    """
+
+    @abstractmethod
+    def submit(self, items, batch_size=16, options=None):
+        """Enqueue items not already known, in jobs of `batch_size`; returns how many."""
+
+    @abstractmethod
+    def lease(self, worker_id, lease_seconds=60):
+        """Return (job_id, items, options) or None when nothing is available."""
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id, lease_seconds=60):
+        """Extend a lease; returns False if the worker no longer owns the job."""
+
+    @abstractmethod
+    def complete(self, job_id, worker_id, results):
+        """Store {item: result} for a job; returns False if the lease was lost."""
+
+    @abstractmethod
+    def fail(self, job_id, worker_id, error):
+        """Requeue a job after an error (or park it as failed once out of attempts)."""
+
+    @abstractmethod
+    def stats(self):
+        """{status: job count, "items_done": n, "workers": active workers}."""
+
+    @abstractmethod
+    def results(self):
+        """Yield (item, result) for every finished item."""
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Queue stored in a single SQLite file, usable on shared network storage
+    or as a local stand-in. Uses the rollback journal (WAL needs shared
+    memory, which network filesystems do not provide) and BEGIN IMMEDIATE
+    so only one worker at a time can claim a job.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                items         TEXT NOT NULL,
+                options       TEXT,
+                status        TEXT NOT NULL,
+                worker        TEXT,
+                attempts      INTEGER NOT NULL DEFAULT 0,
+                lease_expires REAL,
+                error         TEXT,
+                updated_at    REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, lease_expires);
+            CREATE TABLE IF NOT EXISTS results (
+                item    TEXT PRIMARY KEY,
+                job_id  INTEGER NOT NULL,
+                worker  TEXT,
+                result  TEXT
+            );
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, sql, params=()):
+        """Run one statement inside an immediate (write-locked) transaction."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.conn.execute(sql, params)
+            self.conn.execute("COMMIT")
+            return cur.rowcount
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def submit(self, items, batch_size=16, options=None):
+        """Enqueue items not already known to the queue, in batches."""
+        now = time.time()
+        opts = json.dumps(options or {})
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read under the write lock: two coordinators cannot both decide
+            # the same item is new
+            known = {row[0] for row in self.conn.execute("SELECT item FROM results")}
+            for (items_json,) in self.conn.execute("SELECT items FROM jobs"):
+                known.update(json.loads(items_json))
+            new = [item for item in items if item not in known]
+            for i in range(0, len(new), batch_size):
+                self.conn.execute(
+                    "INSERT INTO jobs (items, options, status, updated_at) VALUES (?, ?, ?, ?)",
+                    (json.dumps(new[i:i + batch_size]), opts, QUEUED, now))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(new)
+
+    def lease(self, worker_id, lease_seconds=60):
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose workers died too many times are parked as failed
+            self.conn.execute(
+                "UPDATE jobs SET status=?, error=? WHERE status=? AND lease_expires<? "
+                "AND attempts>=?",
+                (FAILED, "lease expired too many times", LEASED, now, self.max_attempts))
+            row = self.conn.execute(
+                "SELECT id, items, options FROM jobs WHERE status=? "
+                "OR (status=? AND lease_expires<?) ORDER BY id LIMIT 1",
+                (QUEUED, LEASED, now)).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE jobs SET status=?, worker=?, lease_expires=?, "
+                    "attempts=attempts+1, updated_at=? WHERE id=?",
+                    (LEASED, worker_id, now + lease_seconds, now, row[0]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2] or "{}")
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=60):
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET lease_expires=?, updated_at=? "
+            "WHERE id=? AND worker=? AND status=?",
+            (now + lease_seconds, now, job_id, worker_id, LEASED)) > 0
+
+    def complete(self, job_id, worker_id, results):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            owned = self.conn.execute(
+                "UPDATE jobs SET status=?, lease_expires=NULL, updated_at=? "
+                "WHERE id=? AND worker=? AND status=?",
+                (DONE, time.time(), job_id, worker_id, LEASED)).rowcount
+            if owned:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO results (item, job_id, worker, result) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(item, job_id, worker_id, json.dumps(result, default=str))
+                     for item, result in results.items()])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return owned > 0
+
+    def fail(self, job_id, worker_id, error):
+        # Back to the queue unless it has used up its attempts
+        return self._write(
+            "UPDATE jobs SET status=CASE WHEN attempts>=? THEN ? ELSE ? END, "
+            "error=?, worker=NULL, lease_expires=NULL, updated_at=? "
+            "WHERE id=? AND worker=?",
+            (self.max_attempts, FAILED, QUEUED, str(error)[:1000], time.time(),
+             job_id, worker_id)) > 0
+
+    def stats(self):
+        counts = dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        counts["items_done"] = self.conn.execute(
+            "SELECT COUNT(*) FROM results").fetchone()[0]
+        counts["workers"] = self.conn.execute(
+            "SELECT COUNT(DISTINCT worker) FROM jobs WHERE status=? AND lease_expires>=?",
+            (LEASED, time.time())).fetchone()[0]
+        return counts
+
+    def results(self):
+        for item, result in self.conn.execute("SELECT item, result FROM results ORDER BY item"):
+            yield item, json.loads(result)
+
+
+def open_queue(spec, max_attempts=3):
+    """
+    Open a queue backend from a spec string.
+    Currently: "sqlite:///path/to/queue.db" or a bare file path.
+    """
+    if spec.startswith("sqlite://"):
+        spec = spec[len("sqlite://"):]
+    return SQLiteJobQueue(spec, max_attempts=max_attempts)
+
+# ---------------------------
+# Worker / coordinator loops
+# ---------------------------
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a job lease in the background while the worker is busy."""
+
+    def __init__(self, queue_spec, job_id, worker_id, lease_seconds):
+        super().__init__(daemon=True)
+        self.queue_spec = queue_spec
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        # SQLite connections cannot be shared across threads: open our own
+        queue = open_queue(self.queue_spec)
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3.0):
+                try:
+                    if not queue.heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                        self.lost = True
+                        return
+                except sqlite3.Error:
+                    continue  # transient lock contention; retry next beat
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(queue_spec, process_func, worker_id=None, lease_seconds=60,
+               poll_interval=2.0, exit_when_idle=False):
+    """
+    Lease jobs from the queue and run `process_func(item, options)` on each item.
+    Per-item failures are stored as {"error": ...} results; a job only fails
+    as a whole if the worker itself crashes (and then its lease expires).
+    """
+    worker_id = worker_id or default_worker_id()
+    queue = open_queue(queue_spec)
+    print(f"👷 Worker {worker_id} polling {queue_spec}")
+    processed = 0
+    try:
+        while True:
+            job = queue.lease(worker_id, lease_seconds)
+            if job is None:
+                if exit_when_idle and not queue.stats().get(LEASED):
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            job_id, items, options = job
+            beat = _Heartbeat(queue_spec, job_id, worker_id, lease_seconds)
+            beat.start()
+            results = {}
+            try:
+                for item in items:
+                    try:
+                        results[item] = process_func(item, options)
+                    except Exception as e:
+                        results[item] = {"error": f"{type(e).__name__}: {e}"}
+                    if beat.lost:
+                        break
+            except BaseException as e:
+                beat.stop()
+                queue.fail(job_id, worker_id, f"{type(e).__name__}: {e}")
+                raise
+            beat.stop()
+
+            if beat.lost or not queue.complete(job_id, worker_id, results):
+                print(f"⚠️ Lost lease on job {job_id}; results discarded.")
+                continue
+            processed += len(items)
+            print(f"✅ Job {job_id}: {len(items)} image(s) done ({processed} total)")
+    finally:
+        queue.close()
+    return processed
+
+
+def run_coordinator(queue_spec, items, batch_size=16, options=None, poll_interval=5.0,
+                    wait=True):
+    """Enqueue items and (optionally) report progress until the queue drains."""
+    queue = open_queue(queue_spec)
+    try:
+        added = queue.submit(items, batch_size=batch_size, options=options)
+        print(f"📤 Queued {added} new image(s) in batches of {batch_size} ({queue_spec})")
+        total = len(items)
+        while wait:
+            stats = queue.stats()
+            print(f"📊 {stats.get('items_done', 0)}/{total} images done | "
+                  f"jobs queued {stats.get(QUEUED, 0)}, leased {stats.get(LEASED, 0)}, "
+                  f"failed {stats.get(FAILED, 0)} | active workers {stats.get('workers', 0)}")
+            if not stats.get(QUEUED) and not stats.get(LEASED):
+                break
+            time.sleep(poll_interval)
+        return queue.stats()
+    finally:
+        queue.close()
@@ -5,8 +5,11 @@
 # =========================================================
 
 from extract_metadata import extract_metadata
-from analyze_content import dominant_colors, detect_edges, extract_text, detect_objects, image_info
+from analyze_content import dominant_colors, detect_edges, extract_text, detect_objects, image_info, \
+    color_signature, load_reduced_rgb
 from img_utils import banner, save_json
+from scheduler import Stage, run_stages
+import rate_scheduler
 import argparse
 import os
 import sys
@@ -19,19 +22,20 @@ from PIL import Image
 from io import BytesIO
 from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
-from geopy.extra.rate_limiter import RateLimiter
 import re
 import html
 import folium
 import requests
-# Auto update check
-try:
-    from auto_update import auto_update_once_per_day
-    import sys
-    force_flag = "--update" in sys.argv or "--force-update" in sys.argv
-    auto_update_once_per_day(force=force_flag)
-except Exception as e:
-    print(f"⚠️ Auto-update skipped: {e}")
+
+
+def auto_update_check():
+    """Background git update check (CLI only; never run on import)."""
+    try:
+        from auto_update import auto_update_once_per_day
+        force_flag = "--update" in sys.argv or "--force-update" in sys.argv
+        auto_update_once_per_day(force=force_flag)
+    except Exception as e:
+        print(f"⚠️ Auto-update skipped: {e}")
 
 
 def get_public_ip_info(timeout=5):
@@ -51,7 +55,7 @@ def get_public_ip_info(timeout=5):
 
     for api in IP_LOOKUP_APIS:
         try:
-            res = requests.get(api, timeout=timeout)
+            res = rate_scheduler.get(api, timeout=timeout)
             if res.status_code == 200:
                 data = res.json()
                 # Extract IP field safely
@@ -65,6 +69,12 @@ def get_public_ip_info(timeout=5):
     return {"error": "All IP lookup services failed."}
 
 
+def _public_ip():
+    """Public IP of this machine (best-effort), or None."""
+    ip_data = get_public_ip_info()
+    return ip_data.get("ip") if isinstance(ip_data, dict) else None
+
+
 # Local modules
 # keep import pattern compatible
 
@@ -90,9 +100,6 @@ def auto_update_and_restart():
         print(f"⚠️ Auto-update skipped: {e}")
 
 
-auto_update_and_restart()
-
-
 # =========================================================
 # BANNER
 # =========================================================
@@ -189,23 +196,19 @@ def _resolve_imgur(url):
     return None
 
 
-def download_image(url, save_path="temp_image.jpg"):
-    """
-    Robust downloader that:
-      - resolves Google Photos, Drive, Dropbox, Imgur public links
-      - sets browser-like headers
-      - retries a few times and reports clear errors
-    """
-    if not url:
-        print("❌ No URL provided.")
-        return None
+# Browser-like headers; some image hosts reject default client headers
+DOWNLOAD_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+    "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
-        "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-    }
 
+def _candidate_urls(url, headers):
+    """
+    Direct-download candidates for a share link, best first
+    (Google Photos, Drive, Dropbox, Imgur resolution).
+    """
     # Quick helpers to try multiple candidate URLs (resolved)
     candidate_urls = [url]
 
@@ -244,22 +247,76 @@ def download_image(url, save_path="temp_image.jpg"):
                             candidate_urls.insert(0, meta_url)
         except Exception:
             pass
+    return candidate_urls
+
+
+def _with_referer(headers, candidate):
+    # Some hosts block requests without Referer; set Referer to candidate domain
+    headers_local = headers.copy()
+    try:
+        headers_local["Referer"] = "/".join(candidate.split("/")[:3])
+    except Exception:
+        pass
+    return headers_local
+
+
+def fetch_image_header(url):
+    """
+    Fetch only the leading bytes of a remote image that hold its metadata
+    (JPEG APP segments up to the first scan) using HTTP Range requests.
+    Returns the bytes, or None when the caller should do a full download
+    (non-JPEG, Range unsupported for this candidate, network errors).
+    """
+    from remote_fetch import fetch_header_bytes
+
+    if not url:
+        return None
+    for candidate in _candidate_urls(url, DOWNLOAD_HEADERS):
+        try:
+            data = fetch_header_bytes(candidate, _with_referer(DOWNLOAD_HEADERS, candidate))
+        except requests.exceptions.RequestException:
+            continue
+        if data:
+            return data
+    return None
+
+
+def download_image(url, save_path="temp_image.jpg", cache=None):
+    """
+    Robust downloader that:
+      - resolves Google Photos, Drive, Dropbox, Imgur public links
+      - sets browser-like headers
+      - retries a few times and reports clear errors
+      - with a DownloadCache, reuses fresh bodies and revalidates stale
+        ones with If-None-Match / If-Modified-Since (304 = no body transfer)
+    """
+    if not url:
+        print("❌ No URL provided.")
+        return None
+
+    headers = DOWNLOAD_HEADERS
+    candidate_urls = _candidate_urls(url, headers)
 
     # Try all candidate URLs with retries
     last_err = None
     for candidate in candidate_urls:
+        cached = cache.lookup(candidate) if cache else None
+        if cached and cache.is_fresh(cached):
+            print("💾 Using cached download (fresh per Cache-Control).")
+            return cache.materialize(cached, save_path)
+
         for attempt in range(3):
             try:
-                # Some hosts block requests without Referer; set Referer to candidate domain
-                headers_local = headers.copy()
-                try:
-                    headers_local["Referer"] = "/".join(
-                        candidate.split("/")[:3])
-                except Exception:
-                    pass
+                headers_local = _with_referer(headers, candidate)
+                if cached:
+                    headers_local.update(cache.conditional_headers(cached))
 
                 resp = requests.get(
                     candidate, headers=headers_local, stream=True, timeout=20)
+                if resp.status_code == 304 and cached:
+                    print("💾 Remote image unchanged (304); using cached copy.")
+                    cache.refresh(candidate, cached, resp.headers)
+                    return cache.materialize(cached, save_path)
                 # handle common client errors quickly
                 if resp.status_code == 403:
                     last_err = f"403 Forbidden for url: {candidate}"
@@ -285,9 +342,14 @@ def download_image(url, save_path="temp_image.jpg"):
 
                 # Save the image
                 with open(save_path, "wb") as f:
-                    for chunk in resp.iter_content(1024):
+                    for chunk in resp.iter_content(64 * 1024):
                         if chunk:
                             f.write(chunk)
+                if cache:
+                    try:
+                        cache.store(candidate, resp.headers, save_path)
+                    except OSError as e:
+                        print(f"⚠️ Could not cache download: {e}")
                 return save_path
 
             except requests.exceptions.HTTPError as he:
@@ -339,7 +401,7 @@ def ip_to_geolocation(ip):
 
     for svc in services:
         try:
-            res = requests.get(svc, timeout=10)
+            res = rate_scheduler.get(svc, timeout=10)
             # if provider returned non-JSON or non-200, skip
             if res.status_code != 200:
                 continue
@@ -405,7 +467,7 @@ def ip_to_geolocation(ip):
             continue
             # Last fallback: ipwho.is
     try:
-        res = requests.get(f"https://ipwho.is/{ip}", timeout=10)
+        res = rate_scheduler.get(f"https://ipwho.is/{ip}", timeout=10)
         if res.status_code == 200:
             data = res.json()
             if data.get("success"):
@@ -436,7 +498,11 @@ def convert_to_degrees(value):
         return None
 
 
-def gps_to_location(gps_data):
+def gps_to_location(gps_data, wait_timeout=None):
+    """
+    Reverse-geocode EXIF GPS through Nominatim. `wait_timeout` bounds the
+    wait for a rate-limit slot (default: the gps_location stage timeout).
+    """
     if not gps_data or "GPSLatitude" not in gps_data or "GPSLongitude" not in gps_data:
         return None
     try:
@@ -449,11 +515,13 @@ def gps_to_location(gps_data):
         if gps_data.get("GPSLongitudeRef") == "W":
             lon = -lon
         geolocator = Nominatim(user_agent="imgmapon_locator", timeout=10)
-        reverse = RateLimiter(geolocator.reverse, min_delay_seconds=1)
-        location = reverse((lat, lon), language="en")
 
         for _ in range(3):
             try:
+                # Every attempt (retries included) waits for a machine-wide
+                # Nominatim slot: one request per second across all processes
+                rate_scheduler.acquire("nominatim", timeout=wait_timeout
+                                       or STAGE_TIMEOUTS["gps_location"])
                 location = geolocator.reverse((lat, lon), language="en")
                 if location and hasattr(location, 'raw'):
                     address = location.raw.get("address", {})
@@ -476,8 +544,10 @@ def gps_to_location(gps_data):
                         "country": location.raw.get("address", {}).get("country", "Unknown"),
                         "city": location.raw.get("address", {}).get("city", None)
                     }
+            except rate_scheduler.RateLimitTimeout:
+                break
             except Exception:
-                time.sleep(1)
+                continue
         return {"latitude": float(lat), "longitude": float(lon), "address": "Not found"}
     except Exception as e:
         return None
@@ -595,38 +665,452 @@ def generate_map(data, map_filename=MAP_FILENAME):
 # =========================================================
 # CORE PROCESSING
 # =========================================================
-def process_image(image_path, args):
-    results = {}
+# Default per-stage time budget in seconds (None = wait indefinitely)
+STAGE_TIMEOUTS = {
+    "gps_location": 30,
+    "ip": 20,
+    "ip_location": 30,
+    "text": 60,
+    "forensics": 120,
+    "reverse_search": 90,
+}
+
+
+def build_stages(image_path, args, ip_resolver=None, pixels=None):
+    """
+    Describe the requested analysis as a dependency graph of stages.
+    Independent stages (network lookups, OpenCV, tesseract, YOLO) run
+    concurrently; only gps_location waits for metadata and ip_location
+    waits for the IP to be resolved.
+    `pixels` (already decoded RGB) feeds the pixel analyzers instead of
+    `image_path`, which is then only read for metadata.
+    """
+    source = image_path if pixels is None else pixels
+    override = getattr(args, "stage_timeout", None)
+
+    def timeout(name):
+        return override if override else STAGE_TIMEOUTS.get(name)
+
+    stages = []
     if args.metadata:
-        meta = image_info(image_path)
-        results["metadata"] = meta
-        gps = meta.get("gps", {})
-        results["gps"] = gps
-        results["gps_location"] = gps_to_location(gps)
+        stages.append(Stage("metadata", lambda: image_info(image_path)))
+        stages.append(Stage(
+            "gps_location", lambda meta: gps_to_location(meta.get("gps", {}),
+                                         wait_timeout=timeout("gps_location")),
+            deps=["metadata"], timeout=timeout("gps_location")))
     if args.colors:
-        colors = dominant_colors(image_path)
-        results["dominant_colors"] = [tuple(map(int, c)) for c in colors]
+        k = getattr(args, "k_colors", 5)
+        stages.append(Stage(
+            "dominant_colors",
+            lambda: [tuple(map(int, c)) for c in dominant_colors(source, k=k)],
+            timeout=timeout("dominant_colors"),
+            # Under a deadline: cluster a 1/4-scale decode instead
+            degraded=lambda: [tuple(map(int, c))
+                              for c in dominant_colors(load_reduced_rgb(source), k=k)]))
+    if getattr(args, "color_index", None):
+        stages.append(Stage("color_signature", lambda: color_signature(source),
+                            timeout=timeout("color_signature")))
     if args.edges:
-        edges = detect_edges(image_path)
-        results["edges"] = edges.tolist() if hasattr(
-            edges, 'tolist') else edges
+        def _edges(image=source):
+            edges = detect_edges(image, low=getattr(args, "canny_low", 100),
+                                 high=getattr(args, "canny_high", 200))
+            return edges.tolist() if hasattr(edges, 'tolist') else edges
+        stages.append(Stage("edges", _edges, timeout=timeout("edges"),
+                            degraded=lambda: _edges(load_reduced_rgb(source))))
     if args.text:
-        text = extract_text(image_path)
-        results["text"] = text
+        text_timeout = timeout("text")
+        stages.append(Stage(
+            "text", lambda: extract_text(source, timeout=text_timeout or 0),
+            timeout=text_timeout))
     if args.objects:
-        objects = detect_objects(image_path)
-        results["objects"] = objects
+        stages.append(Stage("objects", lambda: detect_objects(source),
+                            timeout=timeout("objects")))
+    if getattr(args, "forensics", False):
+        from forensics import analyze_tampering
+        # Heatmaps only where asked (the CLI defaults to imgmapon_forensics)
+        out_dir = getattr(args, "forensics_dir", None)
+        stages.append(Stage(
+            "forensics", lambda: analyze_tampering(source, out_dir=out_dir),
+            timeout=timeout("forensics"),
+            # Under a deadline: error level analysis only
+            degraded=lambda: analyze_tampering(source, out_dir=out_dir,
+                                               copy_move_check=False)))
     if args.search:
-        results["reverse_search"] = "🔍 Feature under development"
+        from reverse_lookup import get_client, parse_providers, parse_endpoints
+        client = get_client(
+            providers=parse_providers(getattr(args, "search_providers", None)),
+            # No directory: no disk cache (the CLI defaults to imgmapon_search_cache)
+            cache_dir=getattr(args, "search_cache", None),
+            endpoints=parse_endpoints(getattr(args, "search_endpoint", None)))
+        # The encoded image is uploaded (worker processes get the full bytes)
+        stages.append(Stage(
+            "reverse_search",
+            lambda: client.search(image_path, image_url=getattr(args, "url", None)),
+            timeout=timeout("reverse_search")))
+    if ip_resolver is not None:
+        stages.append(Stage("ip", ip_resolver, timeout=timeout("ip")))
+        stages.append(Stage("ip_location", ip_to_geolocation,
+                            deps=["ip"], timeout=timeout("ip_location")))
+    return stages
+
+
+def process_image(image_path, args, ip_resolver=None, pixels=None):
+    """
+    Run the requested analyzers on one image.
+    `ip_resolver` is an optional zero-argument callable returning the IP to
+    geolocate; passing it lets the IP lookup overlap with the image stages.
+    `pixels` is the image already decoded (see build_stages).
+    With `args.deadline` (seconds) the stages are first fitted into that
+    budget from learned costs (profiles.py): expensive ones are degraded or
+    skipped, and whatever is still running at the deadline is dropped.
+    """
+    stages = build_stages(image_path, args, ip_resolver, pixels=pixels)
+    deadline = getattr(args, "deadline", None)
+    if deadline:
+        from profiles import plan, learn, megapixels, stage_costs
+        started = time.monotonic()
+        # No path: learned in memory only (the CLI defaults to imgmapon_stage_costs.json)
+        costs = stage_costs(getattr(args, "stage_costs", None))
+        mp = megapixels(image_path, pixels)
+        stages, decisions, estimate = plan(stages, deadline, costs, mp)
+        outputs, timings, errors = run_stages(stages, deadline=started + deadline)
+        learn(costs, timings, errors, decisions, mp)
+        costs.save()
+    else:
+        outputs, timings, errors = run_stages(stages)
+
+    results = {}
+    if "metadata" in outputs:
+        meta = outputs["metadata"]
+        results["metadata"] = meta
+        results["gps"] = meta.get("gps", {})
+    if args.metadata:
+        results["gps_location"] = outputs.get("gps_location")
+    for key in ("dominant_colors", "color_signature", "edges", "text", "objects", "forensics"):
+        if key in outputs:
+            results[key] = outputs[key]
+    if outputs.get("ip"):
+        results["ip"] = outputs["ip"]
+    if outputs.get("ip_location"):
+        results["ip_location"] = outputs["ip_location"]
+    if "reverse_search" in outputs:
+        results["reverse_search"] = outputs["reverse_search"]
     if args.research:
         results["deep_research"] = "🧠 Feature under development"
+
+    results["stage_timings"] = timings
+    if deadline:
+        skipped = {name: why for name, why in decisions.items() if why != "degraded"}
+        skipped.update({name: err for name, err in errors.items()
+                        if err in ("deadline reached", "skipped: deadline reached")})
+        results["deadline"] = {
+            "profile": getattr(args, "profile", None),
+            "budget_s": deadline,
+            "estimated_s": estimate,
+            "elapsed_s": round(time.monotonic() - started, 3),
+            "skipped": skipped,
+            "degraded": sorted(n for n, why in decisions.items() if why == "degraded"),
+        }
+        for name, why in skipped.items():
+            print(f"⏱️ Stage '{name}' {why}")
+        # Deadline cuts are reported above, not as stage failures
+        errors = {n: e for n, e in errors.items() if n not in skipped}
+    if errors:
+        results["stage_errors"] = errors
+        for name, err in errors.items():
+            print(f"⚠️ Stage '{name}' did not complete: {err}")
     return results
 
 
+def _metadata_only(args):
+    """True when no requested analyzer needs decoded pixels."""
+    return args.metadata and not (args.colors or args.edges or args.text or args.objects
+                                  or getattr(args, "forensics", False)
+                                  or getattr(args, "color_index", None)
+                                  or args.search or args.research)
+
+
+def store_result(args, key, data):
+    """
+    Index one image's results in the --store database and its color
+    signature in the --color-index (if enabled). The signature is removed
+    from `data`; it only lives in the index.
+    """
+    signature = data.pop("color_signature", None)
+    if signature is not None and getattr(args, "color_index", None):
+        try:
+            from color_index import index_signature
+            index_signature(args.color_index, key, signature)
+        except Exception as e:
+            print(f"⚠️ Could not add color signature to index: {e}")
+    if not getattr(args, "store", None):
+        return
+    try:
+        from result_store import record_result
+        record_result(args.store, key, data)
+    except Exception as e:
+        print(f"⚠️ Could not record result in store: {e}")
+
+
+def process_video(video_path, args):
+    """
+    Decode a video in streaming fashion, pick keyframes on scene changes and
+    run each one through process_image. Returns container metadata plus a
+    per-keyframe result list with frame index and timestamp.
+    """
+    import cv2
+    from video_input import video_metadata, iter_keyframes
+
+    info = video_metadata(video_path)
+    results = {"video": info, "frames": []}
+    if info.get("error"):
+        print(f"❌ {info['error']}")
+        return results
+
+    # Phones store capture location in the container, not in the frames
+    location = info.get("ffprobe", {}).get("location")
+    if location and args.metadata:
+        results["gps_location"] = location
+
+    print(f"🎞️ Sampling keyframes from {video_path} "
+          f"({info.get('duration') or '?'}s @ {info.get('fps', 0):.1f} fps)...")
+    for index, timestamp, frame, score in iter_keyframes(
+            video_path, threshold=args.scene_threshold,
+            min_gap=args.min_scene_gap, max_frames=args.max_keyframes):
+        frame_result = {
+            "frame_index": index,
+            "timestamp": timestamp,
+            "scene_score": score,
+        }
+        # Analyzers take decoded pixels (PIL order): no JPEG round-trip per frame
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame_result.update(process_image(rgb, args))
+        store_result(args, f"{video_path}#frame={index}",
+                     dict(frame_result, source="video", video_path=video_path))
+        frame_result.pop("color_signature", None)
+        results["frames"].append(frame_result)
+        print(f"   🖼️ Keyframe #{len(results['frames'])} at {timestamp:.2f}s "
+              f"(frame {index}, change {score:.2f})")
+
+    results["keyframe_count"] = len(results["frames"])
+    return results
+
+
+# Stages that talk to web services rather than read the image
+NETWORK_STAGES = {"gps_location", "ip", "ip_location", "reverse_search"}
+
+
+def _batch_failure(result):
+    """
+    Why a batch item should count as failed, or None. process_image records
+    stage errors instead of raising, so an unreadable image would otherwise
+    be marked done and never retried.
+    """
+    errors = result.get("stage_errors") or {}
+    ran = set(result.get("stage_timings") or {})
+    if not errors or not ran:
+        return None
+    reading = ran - NETWORK_STAGES
+    if ran <= set(errors):
+        failed = ran
+    elif reading and reading <= set(errors):
+        failed = reading  # nothing could read the image: not decodable
+    else:
+        return None
+    return "; ".join(f"{name}: {errors[name]}" for name in sorted(failed))
+
+
+def process_batch(args):
+    """
+    Analyze every image under --input (a directory or a ZIP/TAR archive),
+    resuming from the manifest.
+    """
+    from batch import collect_images, run_batch
+    from archive_input import is_archive, has_index, list_archive_images, \
+        iter_archive_members, split_member_id
+
+    open_items = None
+    if is_archive(args.input):
+        # Members are streamed into the analyzers as in-memory buffers. TAR
+        # streams have no member index: rather than decompress them once to
+        # list and again to read, members are registered as they stream past
+        items = list_archive_images(args.input) if has_index(args.input) else None
+        open_items = lambda todo: iter_archive_members(
+            args.input, wanted=set(todo) if todo is not None else None)
+    else:
+        items = collect_images(args.input)
+    if items is not None and not items:
+        print(f"⚠️ No images found in: {args.input}")
+        return None
+    if getattr(args, "trajectory", False) and not args.metadata:
+        args.metadata = True  # capture time and GPS come from EXIF
+    # Geocoding and IP lookups queue behind interactive runs on this machine
+    rate_scheduler.set_default_priority("batch")
+    waits_before = rate_scheduler.wait_stats()
+
+    def _analyze(item, data, pixels=None):
+        archive_path, member = split_member_id(item)
+        if member is not None:
+            provenance = {"source": "archive", "archive_path": archive_path,
+                          "member_path": member}
+        else:
+            provenance = {"source": "local", "image_path": item}
+        result = dict(process_image(data, args, pixels=pixels), **provenance)
+        failure = _batch_failure(result)
+        if failure:
+            raise RuntimeError(failure)  # the manifest records it and retries
+        store_result(args, item if member is not None else os.path.abspath(item), result)
+        return result
+
+    budget = None
+    pool = None
+    workers = args.workers
+    if getattr(args, "processes", None):
+        from shared_pool import SharedProcessPool, preload_models
+        from adaptive_pool import enabled_analyzers
+        if workers != 1:
+            print("⚠️ --processes replaces --workers; ignoring --workers.")
+        preload_models(args)
+        decode = bool(set(enabled_analyzers(args)) - {"metadata"})
+        # Reverse search uploads the encoded image, not just its header
+        pool = SharedProcessPool(_analyze, args.processes, decode=decode,
+                                 full_payload=bool(args.search))
+        print(f"🧩 {args.processes} worker process(es); models and pixels in shared memory.")
+        workers = 1
+    elif workers == "auto":
+        try:
+            from adaptive_pool import MemoryBudget, enabled_analyzers
+            budget = MemoryBudget(enabled_analyzers(args), max_workers=args.max_workers)
+            print(f"🧮 Adaptive workers: up to {budget.max_workers}, admitted by available memory.")
+        except ImportError:
+            print("⚠️ psutil not installed; using a single worker. Run: pip install psutil")
+        workers = 1
+
+    try:
+        counts = run_batch(
+            items, _analyze, manifest_path=args.manifest, results_dir=args.results_dir,
+            max_attempts=args.max_retries + 1, workers=workers, open_items=open_items,
+            budget=budget, pool=pool)
+    finally:
+        if budget is not None:
+            budget.close()
+        if pool is not None:
+            from shared_pool import print_memory_report
+            print_memory_report(pool.close())
+
+    print("\n========================================================")
+    print("📦 BATCH SUMMARY")
+    print("========================================================")
+    print(f"✅ Done: {counts.get('done', 0)}")
+    print(f"❌ Failed: {counts.get('failed', 0)}")
+    print(f"⏳ Pending: {counts.get('pending', 0) + counts.get('running', 0)}")
+    print(f"📁 Results: {os.path.abspath(args.results_dir)}")
+    rate_scheduler.print_wait_report(since=waits_before)
+    print("========================================================\n")
+
+    if getattr(args, "trajectory", False):
+        from trajectory import build_trajectories, iter_results, write_report
+        write_report(build_trajectories(iter_results(args.results_dir)))
+    return counts
+
+
+# Analyzer switches a coordinator hands to its workers
+ANALYZER_FLAGS = ("metadata", "colors", "edges", "text", "objects", "forensics", "search",
+                  "research")
+
+
+def process_queue(args):
+    """Coordinator/worker mode over a shared job queue (--queue)."""
+    import argparse as _argparse
+    from job_queue import run_coordinator, run_worker, open_queue
+    from batch import collect_images, result_filename
+
+    rate_scheduler.set_default_priority("batch")
+    if args.role == "coordinator":
+        if not args.input:
+            print("⚠️ Coordinator needs --input with the images to distribute.")
+            return None
+        items = [os.path.abspath(p) for p in collect_images(args.input)]
+        options = {flag: bool(getattr(args, flag)) for flag in ANALYZER_FLAGS}
+        stats = run_coordinator(args.queue, items, batch_size=args.batch_size,
+                                options=options, wait=not args.no_wait)
+        if not args.no_wait:
+            os.makedirs(args.results_dir, exist_ok=True)
+            queue = open_queue(args.queue)
+            try:
+                for item, result in queue.results():
+                    save_json(result, os.path.join(args.results_dir, result_filename(item)))
+            finally:
+                queue.close()
+            print(f"📁 Results exported to {os.path.abspath(args.results_dir)}")
+        return stats
+
+    def _work(path, options):
+        # The coordinator decides which analyzers run on its images
+        job_args = _argparse.Namespace(**vars(args))
+        for flag, value in options.items():
+            setattr(job_args, flag, value)
+        result = dict(process_image(path, job_args), source="local", image_path=path)
+        store_result(args, path, result)
+        return result
+
+    return run_worker(args.queue, _work, lease_seconds=args.lease,
+                      exit_when_idle=args.exit_when_idle)
+
+
+def process_watch(args):
+    """Watch --watch DIR and analyze images as they arrive."""
+    from batch import save_result
+    from watch_folder import watch
+
+    rate_scheduler.set_default_priority("batch")
+    os.makedirs(args.results_dir, exist_ok=True)
+
+    def _analyze(path):
+        result = dict(process_image(path, args), source="local", image_path=path)
+        store_result(args, os.path.abspath(path), result)
+        out_path = save_result(path, result, args.results_dir)
+        print(f"✅ {path} -> {out_path}")
+
+    return watch(args.watch, _analyze, state_path=args.watch_state,
+                 settle=args.settle, poll_interval=args.poll_interval,
+                 use_inotify=not args.poll)
+
+
+def _workers_arg(value):
+    """argparse type for --workers: a positive integer or 'auto'."""
+    if value == "auto":
+        return value
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise argparse.ArgumentTypeError("expected a positive integer or 'auto'")
+    return count
+
+
 # =========================================================
 # MAIN
 # =========================================================
 def main():
+    # Update checks belong to the CLI; importing this module has no side effects
+    auto_update_check()
+    auto_update_and_restart()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        from result_store import query_main
+        query_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "palette":
+        from color_index import palette_main
+        palette_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "trajectory":
+        from trajectory import trajectory_main
+        trajectory_main(sys.argv[2:])
+        return
+
     welcome_banner()
     time.sleep(0.8)
     banner()
@@ -635,6 +1119,22 @@ def main():
         description="IMG MAPON - Advanced Image Forensics Tool")
     parser.add_argument('--image', type=str, help="Path to the image file")
     parser.add_argument('--url', type=str, help="URL of the image")
+    parser.add_argument('--full-download', action='store_true',
+                        help="Always download the whole image for --url (no range fetch)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Do not use the on-disk download cache for --url")
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help="Download cache directory (default ~/.cache/imgmapon/downloads)")
+    parser.add_argument('--cache-size', type=float, default=1024,
+                        help="Download cache size limit in MB")
+    parser.add_argument('--video', type=str,
+                        help="Path to a video file (analyzes scene-change keyframes)")
+    parser.add_argument('--scene-threshold', type=float, default=0.35,
+                        help="Histogram distance (0-1) that counts as a scene change")
+    parser.add_argument('--min-scene-gap', type=float, default=1.0,
+                        help="Minimum seconds between two keyframes")
+    parser.add_argument('--max-keyframes', type=int, default=None,
+                        help="Stop after this many keyframes")
     parser.add_argument('--metadata', action='store_true',
                         help="Extract metadata")
     parser.add_argument('--colors', action='store_true',
@@ -645,14 +1145,147 @@ def main():
                         help="Extract text using OCR")
     parser.add_argument('--objects', action='store_true',
                         help="Detect objects")
+    parser.add_argument('--forensics', action='store_true',
+                        help="Tamper analysis: error level analysis and copy-move detection")
+    parser.add_argument('--forensics-dir', type=str, default=None,
+                        help="Where to write forensics heatmaps (default: imgmapon_forensics)")
     parser.add_argument('--search', action='store_true',
                         help="Reverse image search")
+    parser.add_argument('--search-providers', type=str, default="google",
+                        help="Comma-separated reverse search providers (google, yandex)")
+    parser.add_argument('--search-endpoint', action='append', default=None,
+                        metavar="NAME=URL",
+                        help="Send a provider's requests to another base URL "
+                             "(e.g. a local stand-in server); repeatable")
+    parser.add_argument('--search-cache', type=str, default=None,
+                        help="Reverse search cache directory (default: imgmapon_search_cache)")
     parser.add_argument('--research', action='store_true',
                         help="Conduct deep research")
     parser.add_argument('--map', action='store_true',
                         help="Generate interactive map HTML (folium)")
+    parser.add_argument('--stage-timeout', type=float, default=None,
+                        help="Override the per-stage time budget in seconds")
+    parser.add_argument('--profile', choices=["triage", "standard", "deep"], default=None,
+                        help="Analysis profile: enables its analyzers and per-image deadline")
+    parser.add_argument('--deadline', type=float, default=None,
+                        help="Per-image time budget in seconds; expensive stages are "
+                             "degraded or skipped to meet it")
+    parser.add_argument('--stage-costs', type=str, default=None,
+                        help="Learned stage cost table (default: imgmapon_stage_costs.json)")
+    parser.add_argument('--input', type=str,
+                        help="Directory or ZIP/TAR archive of images to analyze as a resumable batch")
+    parser.add_argument('--workers', type=_workers_arg, default=1,
+                        help="Images analyzed in parallel during batch runs, or 'auto' "
+                             "to scale with available memory")
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help="Upper bound for --workers auto (default: CPU count)")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Run batch analysis on N worker processes that share the "
+                             "loaded models and decoded pixels (reports per-worker memory)")
+    parser.add_argument('--trajectory', action='store_true',
+                        help="After a batch, reconstruct movement from EXIF time + GPS and "
+                             "flag impossible jumps (also: main.py trajectory --results-dir DIR)")
+    parser.add_argument('--manifest', type=str, default="imgmapon_manifest.db",
+                        help="Checkpoint manifest for batch runs (SQLite)")
+    parser.add_argument('--results-dir', type=str, default="imgmapon_results",
+                        help="Directory for per-image batch results")
+    parser.add_argument('--max-retries', type=int, default=2,
+                        help="Retries for failed items in a batch run")
+    parser.add_argument('--store', type=str, default=None,
+                        help="Record results in a queryable SQLite store "
+                             "(search it with: main.py query --store FILE ...)")
+    parser.add_argument('--color-index', type=str, default=None,
+                        help="Add each image's color signature to this palette index "
+                             "(search it with: main.py palette --index DIR ...)")
+    parser.add_argument('--k-colors', type=int, default=5,
+                        help="Number of dominant colors (KMeans k)")
+    parser.add_argument('--canny-low', type=int, default=100,
+                        help="Lower Canny threshold for --edges")
+    parser.add_argument('--canny-high', type=int, default=200,
+                        help="Upper Canny threshold for --edges")
+    parser.add_argument('--feature-cache', type=str, default=None,
+                        help="Cache decoded pixels as memory-mapped .npy files in this "
+                             "directory (speeds up re-runs / parameter sweeps)")
+    parser.add_argument('--feature-max-side', type=int, default=None,
+                        help="Downscale cached pixels so the longest side is at most this")
+    parser.add_argument('--watch', type=str,
+                        help="Watch a drop folder and analyze new or changed images")
+    parser.add_argument('--watch-state', type=str, default="imgmapon_watch_state.json",
+                        help="State file remembering images already processed by --watch")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="Seconds a file must stay unchanged before --watch processes it")
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help="Rescan interval when inotify is unavailable")
+    parser.add_argument('--poll', action='store_true',
+                        help="Force polling instead of inotify for --watch")
+    parser.add_argument('--queue', type=str,
+                        help="Shared job queue (SQLite file / sqlite:///path) for distributed runs")
+    parser.add_argument('--role', choices=["coordinator", "worker"], default="worker",
+                        help="Role in a --queue run")
+    parser.add_argument('--batch-size', type=int, default=16,
+                        help="Images per queued job")
+    parser.add_argument('--lease', type=float, default=120,
+                        help="Seconds a worker owns a job between heartbeats")
+    parser.add_argument('--exit-when-idle', action='store_true',
+                        help="Worker exits once the queue is drained")
+    parser.add_argument('--no-wait', action='store_true',
+                        help="Coordinator only enqueues and exits")
     args = parser.parse_args()
 
+    if args.processes:
+        from shared_pool import fork_available
+        if args.processes < 1:
+            parser.error("--processes expects a positive number")
+        if not fork_available():
+            parser.error("--processes needs the 'fork' start method, which this platform "
+                         "lacks; use --workers instead")
+
+    if args.profile:
+        from profiles import apply_profile
+        apply_profile(args, args.profile)
+
+    # Checked once here, not per image inside the search stage
+    from reverse_lookup import parse_providers, parse_endpoints
+    try:
+        parse_providers(args.search_providers)
+        parse_endpoints(args.search_endpoint)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Files the library only writes when asked to; the CLI keeps them by default
+    if not args.forensics_dir:
+        from forensics import DEFAULT_FORENSICS_DIR
+        args.forensics_dir = DEFAULT_FORENSICS_DIR
+    if not args.search_cache:
+        from reverse_lookup import DEFAULT_SEARCH_CACHE
+        args.search_cache = DEFAULT_SEARCH_CACHE
+    if not args.stage_costs:
+        from profiles import DEFAULT_COSTS_PATH
+        args.stage_costs = DEFAULT_COSTS_PATH
+
+    if args.feature_cache:
+        from feature_cache import FeatureCache
+        from analyze_content import set_feature_cache
+        set_feature_cache(FeatureCache(args.feature_cache, max_side=args.feature_max_side))
+
+    if args.queue:
+        process_queue(args)
+        return
+
+    if args.watch:
+        if not os.path.isdir(args.watch):
+            print(f"❌ Watch folder not found: {args.watch}")
+            return
+        process_watch(args)
+        return
+
+    if args.input:
+        if not os.path.exists(args.input):
+            print(f"❌ Input not found: {args.input}")
+            return
+        process_batch(args)
+        return
+
     if args.image:
         image_path = args.image
         if not os.path.exists(image_path):
@@ -660,22 +1293,55 @@ def main():
             return
         results = {"source": "local", "image_path": image_path}
         # local machine IP for origin (best-effort)
-        ip_data = get_public_ip_info()
-        ip = ip_data.get("ip") if isinstance(ip_data, dict) else None
+        ip_resolver = _public_ip
 
     elif args.url:
-        image_path = download_image(args.url)
+        image_path = None
+        if _metadata_only(args) and not args.full_download:
+            # EXIF/GPS sit in the first kilobytes of a JPEG: skip the pixel data.
+            # The analyzers accept the header bytes in place of a path.
+            image_path = fetch_image_header(args.url)
+            if image_path:
+                print(f"📡 Fetched {len(image_path)} header bytes via HTTP range request.")
+        if image_path is None:
+            cache = None
+            if not args.no_cache:
+                from download_cache import DownloadCache, DEFAULT_CACHE_DIR
+                cache = DownloadCache(args.cache_dir or DEFAULT_CACHE_DIR,
+                                      max_bytes=int(args.cache_size * 1024 * 1024))
+            image_path = download_image(args.url, cache=cache)
         if not image_path:
             return
         host_ip = get_host_ip(args.url)
         results = {"source": "url", "image_url": args.url, "host_ip": host_ip}
-        ip = host_ip
+        ip_resolver = lambda: host_ip
+    elif args.video:
+        image_path = args.video
+        if not os.path.exists(image_path):
+            print(f"❌ File not found: {image_path}")
+            return
+        results = {"source": "video", "video_path": image_path}
+        ip_resolver = _public_ip
     else:
-        print("⚠️ Please provide --image or --url.")
+        print("⚠️ Please provide --image, --url or --video.")
         return
 
-    data = process_image(image_path, args)
+    # The IP lookup runs alongside the image analyzers instead of after them
+    if args.video:
+        outputs, _, _ = run_stages([
+            Stage("video", lambda: process_video(image_path, args)),
+            Stage("ip", ip_resolver, timeout=STAGE_TIMEOUTS.get("ip")),
+            Stage("ip_location", ip_to_geolocation, deps=["ip"],
+                  timeout=STAGE_TIMEOUTS.get("ip_location")),
+        ])
+        data = outputs.get("video") or {}
+        if outputs.get("ip_location"):
+            data["ip_location"] = outputs["ip_location"]
+    else:
+        data = process_image(image_path, args, ip_resolver=ip_resolver)
     data.update(results)
+    if not args.video:
+        store_result(args, args.image and os.path.abspath(args.image) or args.url, data)
     # Only use IP location if GPS is missing
     if data.get("gps_location") and data["gps_location"].get("latitude"):
         print("✅ Using GPS location from EXIF as primary source.")
@@ -683,12 +1349,9 @@ def main():
         print("⚠️ No GPS in image; using IP-based location as fallback.")
 
     # Always include IP-based location (even if GPS exists)
-    ip_info = ip_to_geolocation(ip)
-    if ip_info is None:
+    if not data.get("ip_location"):
         # helpful debug if you saw a provider error earlier
         print("⚠️ IP geolocation failed (rate-limited or no provider succeeded). Using IP as best-effort only.")
-    else:
-        data["ip_location"] = ip_info
 
     # Save JSON results
     try:
@@ -719,10 +1382,20 @@ def main():
     print("\n========================================================")
     print("🧠 ANALYSIS SUMMARY")
     print("========================================================")
-    meta = data.get("metadata", {})
-    print(f"📸 Format: {meta.get('format', 'Unknown')}")
-    print(f"🎨 Mode: {meta.get('mode', 'Unknown')}")
-    print(f"📏 Size: {meta.get('size', 'Unknown')}")
+    if "video" in data:
+        video = data["video"]
+        print(f"🎞️ Container: {video.get('container', 'Unknown')} "
+              f"({video.get('codec') or 'unknown codec'})")
+        print(f"⏱️ Duration: {video.get('duration', 'Unknown')}s "
+              f"@ {video.get('fps', 0):.1f} fps")
+        print(f"🖼️ Keyframes analyzed: {data.get('keyframe_count', 0)}")
+        for frame in data.get("frames", []):
+            print(f"   - {frame['timestamp']:.2f}s (frame {frame['frame_index']})")
+    else:
+        meta = data.get("metadata", {})
+        print(f"📸 Format: {meta.get('format', 'Unknown')}")
+        print(f"🎨 Mode: {meta.get('mode', 'Unknown')}")
+        print(f"📏 Size: {meta.get('size', 'Unknown')}")
 
     gps_info = data.get("gps_location")
     if gps_info:
@@ -769,6 +1442,37 @@ def main():
     else:
         print("\n🔠 Extracted Text: N/A")
 
+    if "reverse_search" in data:
+        print("\n🔍 Reverse Image Search:")
+        for provider, found in data["reverse_search"].items():
+            if "error" in found:
+                print(f"   {provider}: ❌ {found['error']}")
+                continue
+            cached = " (cached)" if found.get("cached") else ""
+            print(f"   {provider}{cached}: best guess '{found.get('best_guess')}', "
+                  f"{len(found.get('matches', []))} match(es)")
+            for match in found.get("matches", [])[:5]:
+                print(f"   - {match.get('title')} | {match.get('url')}")
+
+    if "forensics" in data:
+        forensic = data["forensics"]
+        ela = forensic.get("ela", {})
+        print("\n🕵️ Tamper Analysis:")
+        print(f"   ELA: {len(ela.get('suspicious_boxes', []))} suspicious region(s), "
+              f"max error {ela.get('max_error')}")
+        copy_move = forensic.get("copy_move")
+        if copy_move is not None:
+            if copy_move["detected"]:
+                print(f"   ⚠️ Copy-move: {len(copy_move['regions'])} duplicated region(s)")
+                for region in copy_move["regions"][:5]:
+                    print(f"   - {region['source']} -> {region['target']} "
+                          f"({region['pairs']} matching blocks)")
+            else:
+                print("   Copy-move: none found")
+        for key in ("ela", "copy_move"):
+            if forensic.get(key, {}).get("heatmap"):
+                print(f"   🖼️ {key} heatmap: {forensic[key]['heatmap']}")
+
     print("\n========================================================")
     if map_path:
         print(f"🗺️ Map file: {map_path} (open in browser)")
@@ -0,0 +1,225 @@
+# profiles.py
+# IMG MAPON - Analysis profiles and per-image deadline planning
+# Author: ICITIFY TECH
+
+import json
+import os
+import threading
+
+DEFAULT_COSTS_PATH = "imgmapon_stage_costs.json"
+
+# Named profiles: analyzers switched on and the default per-image budget
+PROFILES = {
+    "triage": {"analyzers": ("metadata", "colors"), "deadline": 2.0},
+    "standard": {"analyzers": ("metadata", "colors", "edges", "text"), "deadline": 10.0},
+    "deep": {"analyzers": ("metadata", "colors", "edges", "text", "objects", "forensics"),
+             "deadline": None},
+}
+
+# Stages whose cost grows with the image: modelled in seconds per megapixel.
+# The others (network lookups, YOLO at a fixed input size) in seconds per call.
+PIXEL_STAGES = {"dominant_colors", "color_signature", "edges", "text", "forensics"}
+
+# Priors used until a stage has been timed on this machine.
+# "<stage>:degraded" is the cheaper variant (see Stage.degraded).
+PRIOR_COSTS = {
+    "metadata": 0.05,
+    "gps_location": 1.2,  # Nominatim allows one request per second
+    "dominant_colors": 1.5,
+    "dominant_colors:degraded": 0.12,
+    "color_signature": 0.02,
+    "edges": 0.15,
+    "edges:degraded": 0.02,
+    "text": 2.5,
+    "objects": 1.0,
+    "forensics": 0.3,
+    "forensics:degraded": 0.15,
+    "ip": 0.5,
+    "ip_location": 0.6,
+}
+# Share of the budget kept free for estimation error
+SAFETY_MARGIN = 0.85
+
+
+def apply_profile(args, name):
+    """Turn on a profile's analyzers and take its deadline unless one is given."""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile {name!r} (choose from {', '.join(PROFILES)})")
+    profile = PROFILES[name]
+    for analyzer in profile["analyzers"]:
+        setattr(args, analyzer, True)
+    if getattr(args, "deadline", None) is None:
+        args.deadline = profile["deadline"]
+    return args
+
+
+def megapixels(image, pixels=None):
+    """Image size in megapixels from the decoded array or the header only."""
+    if pixels is None and hasattr(image, "shape"):
+        pixels = image
+    if pixels is not None:
+        return pixels.shape[0] * pixels.shape[1] / 1e6
+    if hasattr(image, "size") and isinstance(getattr(image, "size"), tuple):
+        w, h = image.size  # PIL image
+        return w * h / 1e6
+    from adaptive_pool import image_pixels
+    return image_pixels(image) / 1e6
+
+
+def _cost_key(stage_name, degraded=False):
+    return f"{stage_name}:degraded" if degraded else stage_name
+
+
+class StageCosts:
+    """
+    Per-stage cost estimates learned from observed stage_timings.
+
+    Each stage keeps an exponentially weighted mean (seconds, or seconds per
+    megapixel for PIXEL_STAGES), starting from PRIOR_COSTS. The table is
+    stored as JSON so estimates carry over between runs.
+    """
+
+    def __init__(self, path=DEFAULT_COSTS_PATH, alpha=0.2):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self.table = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.table = json.load(f)
+            except (OSError, ValueError):
+                self.table = {}
+
+    def estimate(self, key, mp):
+        base = key.split(":")[0]
+        entry = self.table.get(key)
+        rate = entry["rate"] if entry else PRIOR_COSTS.get(key, PRIOR_COSTS.get(base, 0.5))
+        if base in PIXEL_STAGES:
+            return rate * max(mp, 0.05)
+        return rate
+
+    def observe(self, key, seconds, mp):
+        base = key.split(":")[0]
+        rate = seconds / max(mp, 0.05) if base in PIXEL_STAGES else seconds
+        with self._lock:
+            entry = self.table.setdefault(key, {"rate": rate, "n": 0})
+            entry["n"] += 1
+            # Plain mean for the first few samples, then an EWMA that follows drift
+            weight = max(self.alpha, 1.0 / entry["n"])
+            entry["rate"] = round((1 - weight) * entry["rate"] + weight * rate, 6)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self.table, indent=2, sort_keys=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+_costs = {}
+_costs_lock = threading.Lock()
+
+
+def stage_costs(path=DEFAULT_COSTS_PATH):
+    """Shared StageCosts per file (batch threads learn into one table); None: in memory."""
+    with _costs_lock:
+        if path not in _costs:
+            _costs[path] = StageCosts(path)
+        return _costs[path]
+
+
+# ---------------------------
+# Planning
+# ---------------------------
+
+def _estimated_seconds(stages, cost_of):
+    """
+    Expected wall time: stages run concurrently, so the longest dependency
+    chain, but CPU-bound stages still share the cores.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    finish = {}
+
+    def _finish(name):
+        if name not in finish:
+            stage = by_name[name]
+            start = max([_finish(d) for d in stage.deps if d in by_name], default=0.0)
+            finish[name] = start + cost_of(stage)
+        return finish[name]
+
+    critical = max([_finish(s.name) for s in stages], default=0.0)
+    cpu = sum(cost_of(s) for s in stages if s.name in PIXEL_STAGES or s.name == "objects")
+    return max(critical, cpu / float(os.cpu_count() or 1))
+
+
+def plan(stages, deadline, costs, mp):
+    """
+    Fit `stages` into `deadline` seconds.
+
+    While the estimate exceeds the budget, the most expensive remaining stage
+    is switched to its degraded variant if it has one, otherwise skipped
+    (with every stage depending on it). Metadata is always kept.
+    Returns (stages to run, {stage: "degraded"|reason}, estimated seconds);
+    degraded stages have their func replaced.
+    """
+    degraded = set()
+    skipped = {}
+    active = list(stages)
+
+    def cost_of(stage):
+        return costs.estimate(_cost_key(stage.name, stage.name in degraded), mp)
+
+    budget = deadline * SAFETY_MARGIN
+    estimate = _estimated_seconds(active, cost_of)
+    while estimate > budget:
+        candidates = [s for s in active if s.name != "metadata"]
+        if not candidates:
+            break
+        victim = max(candidates, key=cost_of)
+        if victim.degraded is not None and victim.name not in degraded:
+            degraded.add(victim.name)
+        else:
+            drop = {victim.name}
+            skipped[victim.name] = (f"skipped: estimated {cost_of(victim):.2f}s "
+                                    f"exceeds the {deadline}s budget")
+            # Dependents cannot run without it
+            changed = True
+            while changed:
+                changed = False
+                for stage in active:
+                    if stage.name not in drop and any(d in drop for d in stage.deps):
+                        drop.add(stage.name)
+                        skipped[stage.name] = f"skipped: needs '{victim.name}'"
+                        changed = True
+            active = [s for s in active if s.name not in drop]
+        estimate = _estimated_seconds(active, cost_of)
+
+    for stage in active:
+        if stage.name in degraded:
+            stage.func = stage.degraded
+    decisions = dict(skipped)
+    decisions.update({name: "degraded" for name in degraded if name not in skipped})
+    return active, decisions, round(estimate, 3)
+
+
+def learn(costs, timings, errors, decisions, mp):
+    """Fold one image's stage_timings into the cost table."""
+    for name, seconds in timings.items():
+        key = _cost_key(name, decisions.get(name) == "degraded")
+        error = errors.get(name)
+        if error == "deadline reached":
+            # Cut short: the real cost is at least this, so only raise the
+            # estimate (otherwise an underestimated stage is retried forever)
+            if seconds > costs.estimate(key, mp):
+                costs.observe(key, seconds, mp)
+        elif error and not error.startswith("timed out"):
+            continue  # failed: the time says nothing about the stage's cost
+        else:
+            costs.observe(key, seconds, mp)
@@ -0,0 +1,243 @@
+# rate_scheduler.py
+# IMG MAPON - Machine-wide request scheduler for rate-limited web services
+# Author: ICITIFY TECH
+
+import contextlib
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows: limits hold per process only
+    fcntl = None
+
+STATE_DIR = os.environ.get("IMGMAPON_RATE_DIR") or os.path.join(
+    tempfile.gettempdir(), "imgmapon_ratelimits")
+
+# (requests per second, burst) per service. Nominatim's usage policy is an
+# absolute maximum of one request per second; the IP services throttle or
+# ban well below their advertised daily quotas when hit in bursts.
+LIMITS = {
+    "nominatim": (1.0, 1),
+    "ip-api.com": (0.75, 1),   # 45 requests per minute
+    "ipapi.co": (0.5, 1),
+    "ipinfo.io": (0.5, 2),
+    "ipwho.is": (1.0, 2),
+}
+DEFAULT_LIMIT = (1.0, 2)
+
+# Lower rank is served first: a user waiting on one image goes ahead of
+# whatever backlog batch, watch and queue workers have built up
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+POLL_INTERVAL = 0.2    # how often a waiter that is not first in line looks again
+STALE_AFTER = 5.0      # a waiter not seen for this long has died: drop it
+# Wait-time histogram buckets (upper bounds, seconds)
+WAIT_BUCKETS = (0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+_default_priority = "interactive"
+_thread_lock = threading.Lock()
+_tickets = itertools.count()
+
+
+class RateLimitTimeout(TimeoutError):
+    """No slot was granted within the caller's timeout."""
+
+
+def set_default_priority(priority):
+    """Priority of requests made without an explicit one (batch modes set 'batch')."""
+    global _default_priority
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r} (choose from {', '.join(PRIORITIES)})")
+    _default_priority = priority
+
+
+def service_for(url):
+    """Scheduler key of a URL: its host name without 'www.'."""
+    host = (urlparse(url).hostname or url).lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _state_path(service):
+    safe = "".join(c if c.isalnum() or c in ".-_" else "_" for c in service)
+    return os.path.join(STATE_DIR, f"{safe}.json")
+
+
+@contextlib.contextmanager
+def _locked_state(service):
+    """
+    Exclusive access to one service's shared state (token bucket, waiting
+    line, wait metrics). The state lives in a small JSON file held under an
+    flock, so every IMG MAPON process on the machine sees the same bucket.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with _thread_lock if fcntl is None else contextlib.nullcontext(), \
+            open(_state_path(service), "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            state = json.loads(f.read() or "{}")
+        except ValueError:
+            state = {}  # torn write from a killed process: start over
+        yield state
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(state))
+        f.flush()
+
+
+def _refill(state, rate, burst, now):
+    tokens = state.get("tokens", float(burst))
+    elapsed = max(0.0, now - state.get("updated", now))
+    state["tokens"] = min(float(burst), tokens + elapsed * rate)
+    state["updated"] = now
+
+
+def _record_wait(state, priority, waited):
+    stats = state.setdefault("stats", {}).setdefault(
+        priority, {"count": 0, "wait_total": 0.0, "wait_max": 0.0,
+                   "buckets": [0] * (len(WAIT_BUCKETS) + 1)})
+    stats["count"] += 1
+    stats["wait_total"] = round(stats["wait_total"] + waited, 6)
+    stats["wait_max"] = max(stats["wait_max"], round(waited, 6))
+    index = next((i for i, bound in enumerate(WAIT_BUCKETS) if waited <= bound),
+                 len(WAIT_BUCKETS))
+    stats["buckets"][index] += 1
+
+
+def acquire(service, priority=None, timeout=None):
+    """
+    Block until `service` may be sent one request; returns the seconds waited.
+
+    Requests leave a shared token bucket (LIMITS) in priority order, then
+    first come first served, across all threads and processes on this
+    machine. Raises RateLimitTimeout if no slot comes within `timeout`.
+    """
+    priority = priority or _default_priority
+    rate, burst = LIMITS.get(service, DEFAULT_LIMIT)
+    ticket = f"{os.getpid()}-{threading.get_ident()}-{next(_tickets)}"
+    started = time.time()
+    entry = {"id": ticket, "rank": PRIORITIES[priority], "since": started}
+    try:
+        while True:
+            with _locked_state(service) as state:
+                now = time.time()
+                _refill(state, rate, burst, now)
+                entry["seen"] = now
+                line = [w for w in state.get("waiting", [])
+                        if w["id"] != ticket and now - w["seen"] <= STALE_AFTER]
+                line.append(entry)
+                line.sort(key=lambda w: (w["rank"], w["since"]))
+                first = line[0]["id"] == ticket
+                if first and state["tokens"] >= 1.0:
+                    state["tokens"] -= 1.0
+                    state["waiting"] = line[1:]
+                    waited = now - started
+                    _record_wait(state, priority, waited)
+                    entry = None
+                    return waited
+                state["waiting"] = line
+                # First in line sleeps until its token; the rest re-check
+                # often enough to keep their place (and notice new arrivals)
+                pause = (1.0 - state["tokens"]) / rate if first else POLL_INTERVAL
+            pause = min(pause, POLL_INTERVAL * 5)
+            if timeout is not None:
+                left = started + timeout - time.time()
+                if left <= 0:
+                    raise RateLimitTimeout(
+                        f"no {service} request slot within {timeout}s")
+                pause = min(pause, left)
+            time.sleep(max(pause, 0.005))
+    finally:
+        if entry is not None:
+            # Gave up (timeout, interrupt): leave the line at once
+            with _locked_state(service) as state:
+                state["waiting"] = [w for w in state.get("waiting", []) if w["id"] != ticket]
+
+
+@contextlib.contextmanager
+def throttled(service, priority=None, timeout=None):
+    """`with throttled("nominatim"): ...` runs the block once a slot is granted."""
+    yield acquire(service, priority=priority, timeout=timeout)
+
+
+def get(url, priority=None, timeout=10, wait_timeout=None, **kwargs):
+    """
+    requests.get through the scheduler, limited by the URL's host. The wait
+    for a slot is bounded too (`wait_timeout`, default the request timeout):
+    RateLimitTimeout lets callers move on to another provider.
+    """
+    import requests
+    acquire(service_for(url), priority=priority,
+            timeout=timeout if wait_timeout is None else wait_timeout)
+    return requests.get(url, timeout=timeout, **kwargs)
+
+# ---------------------------
+# Wait-time metrics
+# ---------------------------
+
+
+def wait_stats():
+    """{service: {priority: {count, wait_total, wait_max, buckets}}} on this machine."""
+    stats = {}
+    if not os.path.isdir(STATE_DIR):
+        return stats
+    for name in sorted(os.listdir(STATE_DIR)):
+        if not name.endswith(".json"):
+            continue
+        service = name[:-len(".json")]
+        with _locked_state(service) as state:
+            if state.get("stats"):
+                stats[service] = json.loads(json.dumps(state["stats"]))
+    return stats
+
+
+def _percentile(buckets, count, q):
+    target = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= target:
+            return WAIT_BUCKETS[i] if i < len(WAIT_BUCKETS) else float("inf")
+    return float("inf")
+
+
+def wait_summary(since=None):
+    """
+    Per service and priority: requests, mean and p95 wait (bucket bound)
+    since an earlier wait_stats() snapshot, or over all time.
+    """
+    since = since or {}
+    summary = {}
+    for service, priorities in wait_stats().items():
+        for priority, now in priorities.items():
+            before = since.get(service, {}).get(priority, {})
+            count = now["count"] - before.get("count", 0)
+            if count <= 0:
+                continue
+            total = now["wait_total"] - before.get("wait_total", 0.0)
+            buckets = [a - b for a, b in itertools.zip_longest(
+                now["buckets"], before.get("buckets", []), fillvalue=0)]
+            summary.setdefault(service, {})[priority] = {
+                "requests": count,
+                "mean_wait": round(total / count, 3),
+                "p95_wait": _percentile(buckets, count, 0.95),
+            }
+    return summary
+
+
+def print_wait_report(since=None):
+    summary = wait_summary(since)
+    if not summary:
+        return
+    print("🚦 Rate-limited requests (wait before sending):")
+    for service, priorities in summary.items():
+        for priority, s in priorities.items():
+            print(f"   {service} [{priority}]: {s['requests']} request(s), "
+                  f"mean {s['mean_wait']:.2f}s, p95 ≤ {s['p95_wait']}s")
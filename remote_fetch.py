@@ -0,0 +1,106 @@
+# remote_fetch.py
+# IMG MAPON - Metadata-only remote fetch via HTTP Range requests
+# Author: ICITIFY TECH
+
+import requests
+
+# First request size: covers a typical JPEG's APP0/APP1 (EXIF) + SOF markers
+INITIAL_RANGE = 64 * 1024
+# Give up on range fetching (and let the caller download fully) past this
+MAX_HEADER_BYTES = 4 * 1024 * 1024
+
+# JPEG markers without a length field
+_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+_SOS = 0xDA
+
+
+def scan_jpeg_header(buf):
+    """
+    Walk JPEG marker segments from the start of `buf`.
+
+    Returns:
+      ("done", n)    - the first n bytes hold every segment up to and
+                       including the Start-Of-Scan header (all metadata)
+      ("need", n)    - at least n bytes are required to continue
+      ("invalid", 0) - not a JPEG (or corrupt); fetch the whole file
+    """
+    if len(buf) < 2:
+        return "need", 2
+    if buf[:2] != b"\xff\xd8":
+        return "invalid", 0
+    pos = 2
+    while True:
+        if pos + 4 > len(buf):
+            return "need", pos + 4
+        if buf[pos] != 0xFF:
+            return "invalid", 0
+        marker = buf[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in _STANDALONE_MARKERS:
+            pos += 2
+            continue
+        seg_end = pos + 2 + int.from_bytes(buf[pos + 2:pos + 4], "big")
+        if marker == _SOS:
+            return ("done", seg_end) if seg_end <= len(buf) else ("need", seg_end)
+        if seg_end > len(buf):
+            return "need", seg_end
+        pos = seg_end
+
+
+def fetch_header_bytes(url, headers=None, timeout=20, initial=INITIAL_RANGE,
+                       max_bytes=MAX_HEADER_BYTES, session=None):
+    """
+    Fetch just enough of a remote JPEG to parse its metadata.
+
+    Starts with `initial` bytes and requests further ranges only when a
+    segment (e.g. a large APP1 with an embedded thumbnail) runs past what
+    has been fetched. If the server ignores Range and answers 200, the full
+    body is returned instead, so the result is always usable.
+
+    Returns bytes, or None when the resource is not a JPEG image or the
+    header is larger than `max_bytes` (caller should fall back).
+    Network errors propagate as requests exceptions.
+    """
+    http = session or requests
+    base_headers = dict(headers or {})
+    # Ranges apply to the encoded body; ask for it unencoded
+    base_headers["Accept-Encoding"] = "identity"
+
+    buf = b""
+    want = initial
+    while True:
+        req_headers = dict(base_headers, Range=f"bytes={len(buf)}-{want - 1}")
+        resp = http.get(url, headers=req_headers, timeout=timeout)
+        ctype = resp.headers.get("Content-Type", "")
+        if resp.status_code == 200:
+            # Server ignored Range: this is already a full download
+            return resp.content if ctype.startswith("image/") else None
+        if resp.status_code == 416:
+            # Range past EOF: what we have is the whole file
+            return buf or None
+        if resp.status_code != 206:
+            resp.raise_for_status()
+            return None
+        if not buf and not ctype.startswith("image/"):
+            return None
+
+        # A server may answer a different range than requested; only append
+        # when it continues exactly where we stopped
+        content_range = resp.headers.get("Content-Range", "")
+        if not content_range.startswith(f"bytes {len(buf)}-"):
+            return None
+        chunk = resp.content
+        buf += chunk
+
+        state, needed = scan_jpeg_header(buf)
+        if state == "done":
+            return buf[:needed]
+        if state == "invalid":
+            return None
+        if len(chunk) < want - (len(buf) - len(chunk)):
+            return buf  # short read: reached end of file
+        want = max(needed, want * 2)
+        if want > max_bytes:
+            return None
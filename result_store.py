@@ -0,0 +1,308 @@
+# result_store.py
+# IMG MAPON - Persistent, indexed SQLite store for analysis results
+# Author: ICITIFY TECH
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STORE = "imgmapon_store.db"
+
+# Result keys too large / not useful to keep in the stored JSON document
+_UNSTORED_KEYS = ("edges",)
+# EXIF values longer than this (MakerNote blobs, thumbnails) are not indexed
+_MAX_EXIF_VALUE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id          INTEGER PRIMARY KEY,
+    key         TEXT NOT NULL UNIQUE,
+    source      TEXT,
+    format      TEXT,
+    width       INTEGER,
+    height      INTEGER,
+    analyzed_at REAL,
+    result      TEXT
+);
+CREATE TABLE IF NOT EXISTS exif (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    tag      TEXT NOT NULL,
+    value    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_exif_tag ON exif(tag, value);
+CREATE INDEX IF NOT EXISTS idx_exif_image ON exif(image_id);
+CREATE TABLE IF NOT EXISTS locations (
+    image_id  INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    kind      TEXT NOT NULL,          -- 'gps' (EXIF) or 'ip' (host/server)
+    latitude  REAL,
+    longitude REAL,
+    country   TEXT COLLATE NOCASE,
+    city      TEXT COLLATE NOCASE,
+    address   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_locations_country ON locations(country, kind);
+CREATE INDEX IF NOT EXISTS idx_locations_latlon ON locations(latitude, longitude);
+CREATE INDEX IF NOT EXISTS idx_locations_image ON locations(image_id);
+CREATE TABLE IF NOT EXISTS objects (
+    image_id   INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    class      TEXT NOT NULL COLLATE NOCASE,
+    confidence REAL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL
+);
+CREATE INDEX IF NOT EXISTS idx_objects_class ON objects(class, confidence);
+CREATE INDEX IF NOT EXISTS idx_objects_image ON objects(image_id);
+"""
+
+# OCR text is full-text indexed; rowid = images.id
+OCR_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS ocr USING fts5(text)"
+OCR_FALLBACK_SCHEMA = "CREATE TABLE IF NOT EXISTS ocr (rowid INTEGER PRIMARY KEY, text TEXT)"
+
+
+def fts_phrase(text):
+    """
+    Plain words as an FTS5 query: every token quoted, so punctuation in OCR
+    searches ('Main-Street', '12.5', "O'Brien") is matched, not parsed.
+    """
+    return " ".join('"' + token.replace('"', '""') + '"' for token in text.split())
+
+
+class ResultStore:
+    """One connection to the result store. Not shared across threads."""
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        try:
+            self.conn.execute(OCR_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: fall back to LIKE matching
+            self.conn.execute(OCR_FALLBACK_SCHEMA)
+            self.fts = False
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    # ---------------------------
+    # Writing
+    # ---------------------------
+
+    def record(self, key, data):
+        """Insert or replace everything known about one analyzed image."""
+        meta = data.get("metadata") or {}
+        size = meta.get("size") or (None, None)
+        doc = {k: v for k, v in data.items() if k not in _UNSTORED_KEYS}
+
+        with self.conn:
+            row = self.conn.execute("SELECT id FROM images WHERE key=?", (key,)).fetchone()
+            if row:
+                image_id = row[0]
+                self.conn.execute("DELETE FROM exif WHERE image_id=?", (image_id,))
+                self.conn.execute("DELETE FROM locations WHERE image_id=?", (image_id,))
+                self.conn.execute("DELETE FROM objects WHERE image_id=?", (image_id,))
+                self.conn.execute("DELETE FROM ocr WHERE rowid=?", (image_id,))
+                self.conn.execute(
+                    "UPDATE images SET source=?, format=?, width=?, height=?, "
+                    "analyzed_at=?, result=? WHERE id=?",
+                    (data.get("source"), meta.get("format"), size[0], size[1],
+                     time.time(), json.dumps(doc, default=str), image_id))
+            else:
+                image_id = self.conn.execute(
+                    "INSERT INTO images (key, source, format, width, height, analyzed_at, result) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, data.get("source"), meta.get("format"), size[0], size[1],
+                     time.time(), json.dumps(doc, default=str))).lastrowid
+
+            exif_rows = []
+            for tag, value in (meta.get("exif") or {}).items():
+                if isinstance(value, (bytes, bytearray, dict)):
+                    continue
+                text = str(value)
+                if len(text) <= _MAX_EXIF_VALUE:
+                    exif_rows.append((image_id, str(tag), text))
+            self.conn.executemany(
+                "INSERT INTO exif (image_id, tag, value) VALUES (?, ?, ?)", exif_rows)
+
+            for kind, loc in (("gps", data.get("gps_location")), ("ip", data.get("ip_location"))):
+                if loc and loc.get("latitude") is not None:
+                    self.conn.execute(
+                        "INSERT INTO locations (image_id, kind, latitude, longitude, "
+                        "country, city, address) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (image_id, kind, loc.get("latitude"), loc.get("longitude"),
+                         loc.get("country"), loc.get("city"), loc.get("address")))
+
+            obj_rows = []
+            for obj in data.get("objects") or []:
+                if not isinstance(obj, dict):
+                    continue
+                box = list(obj.get("box") or []) + [None] * 4
+                obj_rows.append((image_id, obj.get("class"), obj.get("confidence"), *box[:4]))
+            self.conn.executemany(
+                "INSERT INTO objects (image_id, class, confidence, x1, y1, x2, y2) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", obj_rows)
+
+            if data.get("text"):
+                self.conn.execute("INSERT INTO ocr (rowid, text) VALUES (?, ?)",
+                                  (image_id, data["text"]))
+        return image_id
+
+    # ---------------------------
+    # Querying
+    # ---------------------------
+
+    def query(self, object_class=None, min_confidence=0.0, country=None, city=None,
+              has_gps=False, text=None, near=None, exif=None, limit=100):
+        """
+        Find images matching every given filter. Each filter is an indexed
+        lookup; `near=(lat, lon, km)` uses a bounding box on the lat/lon index
+        and then an exact haversine check.
+        Returns a list of {"key", "source", "format", "width", "height"}.
+        """
+        clauses, params = [], []
+        if object_class:
+            clauses.append("i.id IN (SELECT image_id FROM objects WHERE class=? AND confidence>=?)")
+            params += [object_class, min_confidence]
+        if country:
+            clauses.append("i.id IN (SELECT image_id FROM locations WHERE country=? AND kind='gps')")
+            params.append(country)
+        if city:
+            clauses.append("i.id IN (SELECT image_id FROM locations WHERE city=? AND kind='gps')")
+            params.append(city)
+        if has_gps:
+            clauses.append("i.id IN (SELECT image_id FROM locations WHERE kind='gps')")
+        if text:
+            if self.fts:
+                clauses.append("i.id IN (SELECT rowid FROM ocr WHERE ocr MATCH ?)")
+                params.append(fts_phrase(text))
+            else:
+                clauses.append("i.id IN (SELECT rowid FROM ocr WHERE text LIKE ?)")
+                params.append(f"%{text}%")
+        for tag, value in (exif or {}).items():
+            clauses.append("i.id IN (SELECT image_id FROM exif WHERE tag=? AND value=?)")
+            params += [tag, value]
+        if near:
+            lat, lon, km = near
+            dlat = km / 111.0
+            dlon = km / (111.0 * max(math.cos(math.radians(lat)), 1e-6))
+            clauses.append(
+                "i.id IN (SELECT image_id FROM locations WHERE kind='gps' "
+                "AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?)")
+            params += [lat - dlat, lat + dlat, lon - dlon, lon + dlon]
+
+        sql = "SELECT i.id, i.key, i.source, i.format, i.width, i.height FROM images i"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY i.id"
+        if limit and not near:
+            sql += f" LIMIT {int(limit)}"
+
+        rows = self.conn.execute(sql, params).fetchall()
+        if near:
+            rows = [r for r in rows if self._within(r[0], near)][:limit or None]
+        return [{"key": r[1], "source": r[2], "format": r[3], "width": r[4], "height": r[5]}
+                for r in rows]
+
+    def _within(self, image_id, near):
+        lat, lon, km = near
+        for plat, plon in self.conn.execute(
+                "SELECT latitude, longitude FROM locations WHERE image_id=? AND kind='gps'",
+                (image_id,)):
+            if haversine_km(lat, lon, plat, plon) <= km:
+                return True
+        return False
+
+    def get(self, key):
+        row = self.conn.execute("SELECT result FROM images WHERE key=?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 6371.0088 * 2 * math.asin(math.sqrt(a))
+
+
+# One connection per (store, thread): batch workers record concurrently
+_local = threading.local()
+
+
+def record_result(store_path, key, data):
+    stores = getattr(_local, "stores", None)
+    if stores is None:
+        stores = _local.stores = {}
+    store = stores.get(store_path)
+    if store is None:
+        store = stores[store_path] = ResultStore(store_path)
+    return store.record(key, data)
+
+# ---------------------------
+# `main.py query` subcommand
+# ---------------------------
+
+
+def query_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="main.py query", description="Query the IMG MAPON result store")
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE,
+                        help="Result store database")
+    parser.add_argument('--object', type=str, help="Detected object class (e.g. car)")
+    parser.add_argument('--min-confidence', type=float, default=0.0,
+                        help="Minimum detection confidence for --object")
+    parser.add_argument('--country', type=str, help="GPS location country")
+    parser.add_argument('--city', type=str, help="GPS location city")
+    parser.add_argument('--has-gps', action='store_true', help="Only images with EXIF GPS")
+    parser.add_argument('--text', type=str, help="Full-text search over OCR text")
+    parser.add_argument('--near', type=str, help="LAT,LON,KM radius around a point")
+    parser.add_argument('--exif', action='append', default=[],
+                        help="EXIF TAG=VALUE match (repeatable)")
+    parser.add_argument('--limit', type=int, default=100, help="Maximum results")
+    parser.add_argument('--json', action='store_true', help="Print full stored results as JSON")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.store):
+        print(f"❌ Result store not found: {args.store}")
+        return []
+
+    near = None
+    if args.near:
+        try:
+            near = tuple(float(x) for x in args.near.split(","))
+            assert len(near) == 3
+        except Exception:
+            print("❌ --near expects LAT,LON,KM")
+            return []
+    exif = dict(item.split("=", 1) for item in args.exif if "=" in item)
+
+    store = ResultStore(args.store)
+    try:
+        t0 = time.time()
+        rows = store.query(object_class=args.object, min_confidence=args.min_confidence,
+                           country=args.country, city=args.city, has_gps=args.has_gps,
+                           text=args.text, near=near, exif=exif, limit=args.limit)
+        elapsed = (time.time() - t0) * 1000
+        if args.json:
+            print(json.dumps([dict(r, result=store.get(r["key"])) for r in rows],
+                             indent=4, default=str))
+        else:
+            for r in rows:
+                print(f"🖼️ {r['key']}  [{r['format'] or '?'} {r['width']}x{r['height']}]")
+        print(f"\n🔎 {len(rows)} match(es) of {store.count()} image(s) in {elapsed:.1f} ms")
+        return rows
+    except sqlite3.OperationalError as e:
+        print(f"❌ Query failed: {e}")
+        return []
+    finally:
+        store.close()
@@ -1,20 +1,385 @@
+# reverse_lookup.py
+# IMG MAPON - Reverse image search through pluggable, pooled providers
+# Author: ICITIFY TECH
+
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+DEFAULT_SEARCH_CACHE = "imgmapon_search_cache"
+DEFAULT_TTL = 7 * 24 * 3600
+# Pages with no matches may be consent or interstitial pages, not a real
+# "nothing found": keep them only briefly
+EMPTY_TTL = 15 * 60
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+# Uploads are downscaled to this size: matching does not need full resolution
+UPLOAD_MAX_SIDE = 1024
+MAX_MATCHES = 10
+
+
+def _classes(element):
+    return (element.get("class") or "").split()
+
+
+def _text(element):
+    return " ".join(part.strip() for part in element.itertext() if part.strip())
+
+
+# ---------------------------
+# Providers
+# ---------------------------
+
+class SearchProvider(ABC):
+    """
+    One reverse-search backend.
+
+    Subclasses say how to build the request for an image (uploaded bytes or
+    a public URL) and how to read results from the page. Pages are parsed
+    incrementally: `handle(element, found)` sees each element as soon as it
+    is closed and returns True once enough has been found, which ends the
+    download early.
+    `base_url` can point the provider at a stand-in server (tests, proxies).
+    """
+
+    name = "provider"
+    base_url = ""
+    concurrency = 2        # requests in flight to this provider
+    rate = 0.5             # requests per second
+    supports_upload = True
+
+    def __init__(self, base_url=None, concurrency=None, rate=None):
+        if base_url:
+            self.base_url = base_url.rstrip("/")
+        if concurrency:
+            self.concurrency = concurrency
+        if rate:
+            self.rate = rate
+
+    @abstractmethod
+    def request(self, image_bytes, image_url):
+        """(method, url, requests kwargs) for one search."""
+
+    @abstractmethod
+    def handle(self, element, found):
+        """Read one parsed element into `found`; True once enough is found."""
+
+
+class GoogleProvider(SearchProvider):
+    """Google 'search by image' (scraped; selectors may need updating)."""
+
+    name = "google"
+    base_url = "https://www.google.com"
+
+    def request(self, image_bytes, image_url):
+        if image_url:
+            return "GET", f"{self.base_url}/searchbyimage", {
+                "params": {"image_url": image_url, "hl": "en"}}
+        return "POST", f"{self.base_url}/searchbyimage/upload", {
+            "files": {"encoded_image": ("image.jpg", image_bytes, "image/jpeg")},
+            "data": {"hl": "en"}}
+
+    def handle(self, element, found):
+        if element.tag == "title" and "title" not in found:
+            found["title"] = (element.text or "").strip()
+        elif element.tag == "div" and "r5a77d" in _classes(element):
+            found["best_guess"] = _text(element)
+        elif element.tag == "a":
+            href = element.get("href") or ""
+            heading = element.find(".//h3")
+            if heading is not None and href.startswith("http"):
+                found.setdefault("matches", []).append(
+                    {"url": href, "title": _text(heading)})
+        return len(found.get("matches", [])) >= MAX_MATCHES
+
+
+class YandexProvider(SearchProvider):
+    """Yandex Images 'similar sites' (needs a public image URL)."""
+
+    name = "yandex"
+    base_url = "https://yandex.com"
+    supports_upload = False
+
+    def request(self, image_bytes, image_url):
+        return "GET", f"{self.base_url}/images/search", {
+            "params": {"rpt": "imageview", "url": image_url}}
+
+    def handle(self, element, found):
+        classes = _classes(element)
+        if element.tag == "title" and "title" not in found:
+            found["title"] = (element.text or "").strip()
+        elif "CbirTags-Item" in classes and "best_guess" not in found:
+            found["best_guess"] = _text(element)
+        elif element.tag == "a" and "CbirSites-ItemTitle" in classes:
+            found.setdefault("matches", []).append(
+                {"url": element.get("href"), "title": _text(element)})
+        return len(found.get("matches", [])) >= MAX_MATCHES
+
+
+PROVIDERS = {
+    "google": GoogleProvider,
+    "yandex": YandexProvider,
+}
+
+
+# ---------------------------
+# Per-provider limits
+# ---------------------------
+
+class _RateLimit:
+    """Spaces requests at least 1/rate seconds apart (thread-safe)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class _Channel:
+    """Pooled session plus concurrency and rate limits for one provider."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=provider.concurrency,
+                              max_retries=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.slots = threading.BoundedSemaphore(provider.concurrency)
+        self.limit = _RateLimit(provider.rate)
+
+
+# ---------------------------
+# Client
+# ---------------------------
+
+def _image_bytes(image):
+    """Encoded bytes of a path / bytes / PIL image / array, plus an upload copy."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        raw = bytes(image)
+    elif isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as f:
+            raw = f.read()
+    else:
+        from analyze_content import open_pil
+        buf = BytesIO()
+        open_pil(image).convert("RGB").save(buf, format="JPEG", quality=90)
+        raw = buf.getvalue()
+    return raw, _upload_copy(raw)
+
+
+def _upload_copy(raw):
+    try:
+        from PIL import Image
+        img = Image.open(BytesIO(raw))
+        if max(img.size) <= UPLOAD_MAX_SIDE and img.format == "JPEG":
+            return raw
+        img.thumbnail((UPLOAD_MAX_SIDE, UPLOAD_MAX_SIDE))
+        buf = BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=85)
+        return buf.getvalue()
+    except Exception:
+        return raw
+
+
+class ReverseSearchClient:
+    """
+    Runs reverse searches on every configured provider.
+
+    - Each provider has its own pooled session, a cap on requests in flight
+      and a request rate, shared by all threads using the client (batch
+      workers), so a batch never floods one provider.
+    - With `cache_dir` (the CLI uses DEFAULT_SEARCH_CACHE), answers are
+      cached on disk under the image's content hash, so the same picture is
+      not searched twice within `ttl` seconds (EMPTY_TTL for pages without
+      matches). Errors are not cached.
+    """
+
+    def __init__(self, providers=("google",), cache_dir=None, ttl=DEFAULT_TTL,
+                 endpoints=None, timeout=15):
+        endpoints = endpoints or {}
+        self.channels = []
+        for name in providers:
+            if name not in PROVIDERS:
+                raise ValueError(f"Unknown search provider {name!r} "
+                                 f"(available: {', '.join(PROVIDERS)})")
+            self.channels.append(_Channel(PROVIDERS[name](base_url=endpoints.get(name))))
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.timeout = timeout
+
+    # ---------------------------
+    # Cache
+    # ---------------------------
+
+    def _cache_path(self, provider, digest):
+        return os.path.join(self.cache_dir, provider, digest[:2], f"{digest}.json")
+
+    def _cached(self, provider, digest):
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(provider, digest)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("fetched_at", 0) > entry.get("ttl", self.ttl):
+            return None
+        return entry["result"]
+
+    def _store(self, provider, digest, result):
+        if not self.cache_dir:
+            return
+        path = self._cache_path(provider, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ttl = self.ttl if result.get("matches") else min(self.ttl, EMPTY_TTL)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fetched_at": time.time(), "ttl": ttl, "result": result}, f)
+        os.replace(tmp, path)
+
+    # ---------------------------
+    # Searching
+    # ---------------------------
+
+    def _fetch(self, channel, upload, image_url):
+        """One request, parsed as it streams in; stops once the provider has enough."""
+        from lxml import etree
+
+        provider = channel.provider
+        method, url, kwargs = provider.request(upload, image_url)
+        found = {}
+        with channel.slots:
+            channel.limit.wait()
+            response = channel.session.request(method, url, stream=True,
+                                               timeout=self.timeout, **kwargs)
+            try:
+                response.raise_for_status()
+                parser = etree.HTMLPullParser(events=("end",))
+                done = False
+                for chunk in response.iter_content(16 * 1024):
+                    parser.feed(chunk)
+                    for _event, element in parser.read_events():
+                        if provider.handle(element, found):
+                            done = True
+                            break
+                    if done:
+                        break
+                if not done:
+                    parser.close()
+                    for _event, element in parser.read_events():
+                        if provider.handle(element, found):
+                            break
+            finally:
+                response.close()  # an early stop drops the rest of the page
+        found.setdefault("best_guess", "Unknown")
+        found.setdefault("matches", [])
+        return found
+
+    def search(self, image=None, image_url=None):
+        """
+        {provider: result or {"error": ...}} for one image. `image` (path,
+        bytes, PIL image or array) is uploaded where needed; `image_url`
+        is used by providers that search by URL.
+        """
+        raw, upload, digest = None, None, None
+        if image is not None:
+            raw, upload = _image_bytes(image)
+            digest = hashlib.blake2b(raw, digest_size=20).hexdigest()
+        elif image_url:
+            digest = hashlib.blake2b(image_url.encode("utf-8"), digest_size=20).hexdigest()
+
+        def _one(channel):
+            provider = channel.provider
+            if not image_url and not provider.supports_upload:
+                return {"error": "needs a public image URL"}
+            if upload is None and not image_url:
+                return {"error": "no image to search"}
+            cached = self._cached(provider.name, digest) if digest else None
+            if cached is not None:
+                return dict(cached, cached=True)
+            try:
+                result = self._fetch(channel, upload, image_url)
+            except Exception as e:
+                return {"error": f"{type(e).__name__}: {e}"}
+            if digest:
+                self._store(provider.name, digest, result)
+            return result
+
+        if len(self.channels) == 1:
+            answers = [_one(self.channels[0])]
+        else:
+            # Providers are independent: ask them at the same time
+            with ThreadPoolExecutor(max_workers=len(self.channels)) as pool:
+                answers = list(pool.map(_one, self.channels))
+        return {channel.provider.name: answer
+                for channel, answer in zip(self.channels, answers)}
+
+
+# One client per configuration; batch threads share its sessions and limits
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(providers=("google",), cache_dir=None, ttl=DEFAULT_TTL,
+               endpoints=None):
+    key = (tuple(providers), cache_dir, ttl, tuple(sorted((endpoints or {}).items())))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ReverseSearchClient(providers, cache_dir=cache_dir, ttl=ttl,
+                                                endpoints=endpoints)
+        return _clients[key]
+
+
+def parse_providers(value):
+    """'google, yandex' -> ['google', 'yandex']; ValueError for unknown names."""
+    names = [name.strip() for name in (value or "google").split(",") if name.strip()]
+    unknown = [name for name in names if name not in PROVIDERS]
+    if unknown or not names:
+        raise ValueError(f"Unknown search provider(s) {', '.join(unknown) or repr(value)} "
+                         f"(available: {', '.join(PROVIDERS)})")
+    return names
+
+
+def parse_endpoints(values):
+    """['google=http://127.0.0.1:8080', ...] -> {'google': 'http://127.0.0.1:8080'}"""
+    endpoints = {}
+    for value in values or []:
+        name, sep, url = value.partition("=")
+        name, url = name.strip(), url.strip()
+        if not sep or not url.startswith(("http://", "https://")):
+            raise ValueError(f"Expected NAME=http(s)://URL, got {value!r}")
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown search provider {name!r} in {value!r} "
+                             f"(available: {', '.join(PROVIDERS)})")
+        endpoints[name] = url
+    return endpoints
 
 
 def reverse_image_search(image_url):
     """
     Performs a Google Images reverse lookup via 'search by image' endpoint.
-    (Limited, basic fallback method.)
+    (Kept for existing callers; see ReverseSearchClient.)
     """
-    try:
-        search_url = "https://www.google.com/searchbyimage"
-        params = {"image_url": image_url}
-        headers = {"User-Agent": "Mozilla/5.0"}
-        r = requests.get(search_url, params=params, headers=headers, timeout=5)
-        soup = BeautifulSoup(r.text, "html.parser")
-        title = soup.title.string if soup.title else "No title"
-        guess = soup.find("div", attrs={"class": "r5a77d"})
-        return {"title": title, "best_guess": guess.text if guess else "Unknown"}
-    except Exception as e:
-        return {"error": str(e)}
+    result = get_client().search(image_url=image_url).get("google", {})
+    if "error" in result:
+        return {"error": result["error"]}
+    return {"title": result.get("title", "No title"), "best_guess": result["best_guess"]}
@@ -0,0 +1,113 @@
+# scheduler.py
+# IMG MAPON - Dependency-aware concurrent stage runner
+# Author: ICITIFY TECH
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Stage:
+    """
+    One unit of analysis work.
+
+    - `func` is called with the results of `deps`, in order.
+    - `timeout` (seconds) bounds how long the caller waits for the stage;
+      a stage that overruns is reported as timed out and its result dropped.
+    - `degraded` is an optional cheaper variant of `func` (same arguments)
+      that a deadline planner may run instead (see profiles.py).
+    """
+
+    def __init__(self, name, func, deps=(), timeout=None, degraded=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.degraded = degraded
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={list(self.deps)})"
+
+
+def run_stages(stages, max_workers=None, deadline=None):
+    """
+    Run stages concurrently as soon as their dependencies have finished.
+    `deadline` (a time.monotonic() value) ends the run: stages still running
+    are dropped and stages not yet started are skipped.
+
+    Network lookups spend their time waiting on sockets and OpenCV / Torch /
+    tesseract release the GIL, so a thread pool is enough to overlap them;
+    single-image latency approaches the longest dependency chain.
+
+    Returns (results, timings, errors):
+      results - {stage name: return value} for stages that succeeded
+      timings - {stage name: seconds} for stages that ran
+      errors  - {stage name: message} for failed, timed out or skipped stages
+    """
+    pending = {stage.name: stage for stage in stages}
+    results, timings, errors = {}, {}, {}
+    running = {}
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers or max(1, len(pending)),
+        thread_name_prefix="imgmapon-stage")
+    try:
+        while pending or running:
+            if deadline is not None and time.monotonic() >= deadline:
+                for name in pending:
+                    errors[name] = "skipped: deadline reached"
+                pending.clear()
+
+            # Launch every stage whose dependencies are satisfied
+            for name, stage in list(pending.items()):
+                failed = [d for d in stage.deps if d in errors]
+                if failed:
+                    errors[name] = f"skipped: dependency '{failed[0]}' failed"
+                    del pending[name]
+                elif all(d in results for d in stage.deps):
+                    args = [results[d] for d in stage.deps]
+                    future = executor.submit(stage.func, *args)
+                    running[future] = (stage, time.monotonic())
+                    del pending[name]
+
+            if not running:
+                # Nothing in flight and nothing launchable: unknown dependencies
+                for name, stage in pending.items():
+                    missing = [d for d in stage.deps if d not in results]
+                    errors[name] = f"skipped: unknown dependency {missing}"
+                pending.clear()
+                break
+
+            # Sleep until a stage finishes or the nearest deadline passes
+            now = time.monotonic()
+            deadlines = [start + stage.timeout - now
+                         for stage, start in running.values() if stage.timeout]
+            if deadline is not None:
+                deadlines.append(deadline - now)
+            wait_for = max(0.0, min(deadlines)) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_for,
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                stage, start = running.pop(future)
+                timings[stage.name] = round(time.monotonic() - start, 4)
+                try:
+                    results[stage.name] = future.result()
+                except Exception as e:
+                    errors[stage.name] = f"{type(e).__name__}: {e}"
+
+            now = time.monotonic()
+            past_deadline = deadline is not None and now >= deadline
+            for future, (stage, start) in list(running.items()):
+                if past_deadline or (stage.timeout and now - start >= stage.timeout):
+                    running.pop(future)
+                    future.cancel()
+                    timings[stage.name] = round(now - start, 4)
+                    if stage.timeout and now - start >= stage.timeout:
+                        errors[stage.name] = f"timed out after {stage.timeout}s"
+                    else:
+                        errors[stage.name] = "deadline reached"
+    finally:
+        # Do not block on timed-out stages; their threads finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, timings, errors
@@ -0,0 +1,414 @@
+# shared_pool.py
+# IMG MAPON - Batch worker processes sharing model weights and decoded pixels
+# Author: ICITIFY TECH
+
+import bisect
+import gc
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from batch import SkippedItem, _read_paths, _progress, _skip, save_result
+
+MB = 1024 * 1024
+
+
+# ---------------------------
+# Model weights
+# ---------------------------
+
+def preload_models(args):
+    """
+    Load the heavy models in the parent before any worker is forked.
+
+    Forked workers then map the same physical pages (copy-on-write) instead
+    of each loading its own ~100 MB of YOLO weights. share_memory() moves the
+    tensors into shared memory as well, so they stay shared even if a worker
+    touches them.
+    """
+    if not getattr(args, "objects", False):
+        return
+    from analyze_content import get_yolo_model
+    model = get_yolo_model()
+    if hasattr(model, "share_memory"):
+        model.share_memory()
+
+
+def _limit_threads(workers):
+    """Split the CPU between worker processes instead of oversubscribing it."""
+    threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    if "cv2" in sys.modules:
+        sys.modules["cv2"].setNumThreads(threads)
+
+
+# ---------------------------
+# Pixel buffers
+# ---------------------------
+
+def put_pixels(pixels):
+    """Copy an array into a new shared memory block; returns (block, descriptor)."""
+    pixels = np.ascontiguousarray(pixels)
+    block = shared_memory.SharedMemory(create=True, size=max(1, pixels.nbytes))
+    view = np.ndarray(pixels.shape, dtype=pixels.dtype, buffer=block.buf)
+    view[...] = pixels
+    del view
+    return block, {"name": block.name, "shape": pixels.shape, "dtype": pixels.dtype.str}
+
+
+def attach_pixels(desc, own_tracker=False):
+    """
+    Zero-copy, read-only view of a block created by put_pixels.
+    The parent owns (and unlinks) the block. A process with its own resource
+    tracker (spawned, not forked) must not track it, or the tracker would
+    unlink it when the worker exits.
+    """
+    try:
+        block = shared_memory.SharedMemory(name=desc["name"], track=False)
+    except TypeError:  # Python < 3.13 registers every attach with the tracker
+        block = shared_memory.SharedMemory(name=desc["name"])
+        if own_tracker:
+            resource_tracker.unregister(block._name, "shared_memory")
+    view = np.ndarray(desc["shape"], dtype=np.dtype(desc["dtype"]), buffer=block.buf)
+    view.flags.writeable = False
+    return block, view
+
+
+def _release(block, unlink=False):
+    try:
+        block.close()
+    except BufferError:
+        pass  # a timed-out stage still holds the view; the mapping goes with the process
+    if unlink:
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _metadata_payload(data):
+    """
+    What a worker needs besides the pixels: paths are passed as-is, in-memory
+    JPEGs are cut down to their header segments (EXIF/GPS) so the compressed
+    scan data is not pickled through the queue.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        from remote_fetch import scan_jpeg_header
+        state, length = scan_jpeg_header(data)
+        if state == "done":
+            return bytes(data[:length])
+    return data
+
+
+def memory_report():
+    """RSS / unique / proportional memory of this process in MB (needs psutil)."""
+    try:
+        import psutil
+        info = psutil.Process().memory_full_info()
+    except Exception:
+        return None
+    report = {"rss_mb": info.rss / MB, "uss_mb": info.uss / MB}
+    if hasattr(info, "pss"):
+        report["pss_mb"] = info.pss / MB
+    weights = weight_memory()
+    if weights:
+        report["weights"] = weights
+    return report
+
+
+def _weight_ranges():
+    """(address, bytes) of every tensor storage of the loaded YOLO model."""
+    import analyze_content
+    model = analyze_content._yolo_model
+    if model is None or "torch" not in sys.modules:
+        return []
+    storages = {}
+    for tensor in itertools.chain(model.parameters(), model.buffers()):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+    return sorted((ptr, size) for ptr, size in storages.items() if size)
+
+
+def weight_memory():
+    """
+    How the model weights sit in this process's memory (Linux only): the
+    resident, private and proportional size of the mappings holding the
+    tensor storages, from /proc/self/smaps. Resident minus private is the
+    part still shared with the parent's copy.
+    """
+    ranges = _weight_ranges()
+    if not ranges:
+        return None
+    starts = [ptr for ptr, _size in ranges]
+    totals = {"weights_mb": sum(size for _ptr, size in ranges) / MB,
+              "rss_mb": 0.0, "private_mb": 0.0, "pss_mb": 0.0}
+    fields = {"Rss:": "rss_mb", "Pss:": "pss_mb",
+              "Private_Clean:": "private_mb", "Private_Dirty:": "private_mb"}
+    try:
+        with open("/proc/self/smaps") as f:
+            holds = False
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if not parts[0].endswith(":"):  # mapping header: lo-hi perms ...
+                    lo, _sep, hi = parts[0].partition("-")
+                    lo, hi = int(lo, 16), int(hi, 16)
+                    i = bisect.bisect_left(starts, lo)
+                    holds = (i < len(ranges) and ranges[i][0] < hi) or \
+                        (i > 0 and ranges[i - 1][0] + ranges[i - 1][1] > lo)
+                elif holds and parts[0] in fields:
+                    totals[fields[parts[0]]] += int(parts[1]) / 1024.0
+    except OSError:
+        return None
+    return totals
+
+
+# ---------------------------
+# Worker process
+# ---------------------------
+
+def _worker_main(process_func, tasks, results, workers):
+    _limit_threads(workers)
+    pid = os.getpid()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        item, payload, desc = task
+        try:
+            block, pixels = attach_pixels(desc) if desc else (None, None)
+            try:
+                result = process_func(item, payload, pixels)
+            finally:
+                del pixels
+                if block is not None:
+                    _release(block)
+            results.put(("done", item, result))
+        except Exception as e:
+            results.put(("failed", item, f"{type(e).__name__}: {e}"))
+    results.put(("memory", pid, memory_report()))
+
+
+def fork_available():
+    return "fork" in mp.get_all_start_methods()
+
+
+class SharedProcessPool:
+    """
+    Batch analysis on worker processes instead of threads.
+
+    - Models are loaded once in the parent (preload_models) and inherited by
+      forked workers, so their weights are shared, not copied per worker.
+    - The parent reads and decodes each image once into a shared memory
+      block; workers attach to it and run the analyzers on the array without
+      unpickling pixels. At most 2 x workers blocks exist at a time.
+    - Each worker has its own task queue, so the parent knows which items a
+      worker holds without waiting to hear from it. When a worker dies (e.g.
+      OOM-killed, even before it reported anything) the oldest item it held
+      (the one it was running) fails, the rest go to other workers, and the
+      worker is replaced.
+    `process_func(item, data, pixels)` runs in the workers; `pixels` is a
+    read-only RGB array, or None when no pixel analyzer is enabled. In-memory
+    `data` is cut to its JPEG header unless `full_payload` is set (analyzers
+    such as reverse search that need the encoded image).
+    Needs the fork start method: workers inherit process_func (a closure
+    over the CLI arguments) and the loaded models rather than pickling them.
+    """
+
+    def __init__(self, process_func, workers, decode=True, full_payload=False):
+        if not fork_available():
+            raise RuntimeError("worker processes need the fork start method")
+        self.ctx = mp.get_context("fork")
+        self.process_func = process_func
+        self.workers = max(1, workers)
+        self.decode = decode
+        self.full_payload = full_payload
+        self.results = self.ctx.Queue()
+        self.procs = {}
+        self.task_queues = {}  # pid -> that worker's task queue
+        self.reports = {}
+        # Forked workers inherit the parent's tracker instead of starting their own
+        resource_tracker.ensure_running()
+        # Keep the garbage collector from touching (and un-sharing) every
+        # object inherited from the parent
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _spawn(self):
+        tasks = self.ctx.Queue()
+        proc = self.ctx.Process(target=_worker_main, daemon=True,
+                                args=(self.process_func, tasks, self.results,
+                                      self.workers))
+        proc.start()
+        self.procs[proc.pid] = proc
+        self.task_queues[proc.pid] = tasks
+
+    # ---------------------------
+    # Rounds
+    # ---------------------------
+
+    def run_round(self, todo, manifest, results_dir, open_items=None):
+        """Same contract as batch._run_round, on worker processes."""
+        started = time.time()
+        done = 0
+        total = len(todo) if todo is not None else None
+        in_flight = {}  # item -> [block, t0, pid]
+        tasks = {}      # item -> (payload, desc), kept to hand the item to another worker
+
+        def _finish(item, ok, value):
+            nonlocal done
+            block, t0, _pid = in_flight.pop(item)
+            tasks.pop(item, None)
+            if block is not None:
+                _release(block, unlink=True)
+            try:
+                if not ok:
+                    raise RuntimeError(value)
+                out_path = save_result(item, value, results_dir)
+                manifest.finish(item, out_path, time.time() - t0)
+                status = "✅"
+            except Exception as e:
+                message = str(e) if not ok else f"{type(e).__name__}: {e}"
+                manifest.fail(item, message, time.time() - t0)
+                status = "❌"
+            done += 1
+            print(_progress(status, done, total, item, t0, started))
+
+        def _dispatch(item):
+            # Least busy worker; the parent records the owner itself
+            owner = min(self.procs, key=lambda pid: sum(
+                1 for entry in in_flight.values() if entry[2] == pid))
+            in_flight[item][2] = owner
+            self.task_queues[owner].put((item, *tasks[item]))
+
+        def _drain(block_until_one):
+            while in_flight:
+                try:
+                    msg = self.results.get(timeout=1.0 if block_until_one else 0)
+                except queue.Empty:
+                    self._check_workers(in_flight, _finish, _dispatch)
+                    if not block_until_one:
+                        return
+                    continue
+                kind = msg[0]
+                if kind in ("done", "failed") and msg[1] in in_flight:
+                    _finish(msg[1], kind == "done", msg[2])
+                    if block_until_one:
+                        return
+
+        source = (open_items or _read_paths)(todo)
+        seen = set()
+        try:
+            for item, data in source:
+                seen.add(item)
+                if isinstance(data, SkippedItem):
+                    _skip(manifest, item, data)
+                    continue
+                manifest.start(item)
+                block, desc = None, None
+                if self.decode:
+                    try:
+                        from analyze_content import load_rgb
+                        block, desc = put_pixels(load_rgb(data))
+                    except Exception as e:
+                        manifest.fail(item, f"decode failed: {type(e).__name__}: {e}", 0.0)
+                        print(f"❌ {item}: could not decode ({type(e).__name__})")
+                        continue
+                in_flight[item] = [block, time.time(), None]
+                tasks[item] = (data if self.full_payload else _metadata_payload(data), desc)
+                _dispatch(item)
+                _drain(False)
+                while len(in_flight) >= 2 * self.workers:
+                    _drain(True)
+        finally:
+            while in_flight:
+                _drain(True)
+
+        for item in todo or ():
+            if item not in seen:
+                manifest.start(item)
+                manifest.fail(item, "item could not be read from input", 0.0)
+
+    def _check_workers(self, in_flight, finish, dispatch):
+        """
+        Replace workers that died. A worker runs its queue in order, so only
+        the oldest item it held can have started: that one fails, the
+        others are dispatched again.
+        """
+        for pid, proc in list(self.procs.items()):
+            if proc.is_alive():
+                continue
+            del self.procs[pid]
+            self.task_queues.pop(pid).close()
+            self._spawn()
+            held = sorted((entry[1], item) for item, entry in in_flight.items()
+                          if entry[2] == pid)
+            for position, (_t0, item) in enumerate(held):
+                if position == 0:
+                    finish(item, False, f"worker process died (exit code {proc.exitcode})")
+                else:
+                    dispatch(item)
+
+    # ---------------------------
+    # Shutdown / memory report
+    # ---------------------------
+
+    def close(self):
+        """Stop the workers; returns {pid: memory report} measured just before exit."""
+        for tasks in self.task_queues.values():
+            tasks.put(None)
+        deadline = time.time() + 30
+        while len(self.reports) < len(self.procs) and time.time() < deadline:
+            try:
+                msg = self.results.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self.procs.values()):
+                    break
+                continue
+            if msg[0] == "memory":
+                self.reports[msg[1]] = msg[2]
+        for proc in self.procs.values():
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        if hasattr(gc, "unfreeze"):
+            gc.unfreeze()
+        return self.reports
+
+
+def print_memory_report(reports):
+    """
+    Per-worker RSS, unique (USS) and proportional (PSS) memory, and how much
+    of the YOLO weights each worker still shares with the parent instead of
+    holding a private copy. RSS - USS alone is not reported as a saving:
+    libraries and interpreter pages inherited at fork are shared anyway.
+    """
+    reports = {pid: r for pid, r in reports.items() if r}
+    if not reports:
+        return
+    print("🧠 Worker memory (MB):")
+    for pid, r in sorted(reports.items()):
+        pss = f", PSS {r['pss_mb']:.0f}" if "pss_mb" in r else ""
+        print(f"   pid {pid}: RSS {r['rss_mb']:.0f}, unique {r['uss_mb']:.0f}{pss}")
+    parent = memory_report()
+    if parent:
+        print(f"   parent: RSS {parent['rss_mb']:.0f}")
+    weights = [r["weights"] for r in reports.values() if r.get("weights")]
+    if not weights:
+        return
+    size = weights[0]["weights_mb"]
+    shared = sum(w["rss_mb"] - w["private_mb"] for w in weights)
+    private = sum(w["private_mb"] for w in weights)
+    print(f"💾 Model weights ({size:.0f} MB): {shared:.0f} MB shared with the parent, "
+          f"{private:.0f} MB privately copied across {len(weights)} worker(s)")
@@ -0,0 +1,360 @@
+# trajectory.py
+# IMG MAPON - EXIF timeline and movement reconstruction over a photo set
+# Author: ICITIFY TECH
+
+import argparse
+import glob
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+DEFAULT_TRAJECTORY_FILE = "imgmapon_trajectory.json"
+DEFAULT_TRAJECTORY_MAP = "imgmapon_trajectory.html"
+EARTH_RADIUS_KM = 6371.0088
+# Faster than this between two photos is physically implausible (airliner ~900 km/h)
+MAX_SPEED_KMH = 1000.0
+# Photos taken at the "same" second more than this far apart are inconsistent
+SAME_TIME_KM = 0.5
+GAP_HOURS = 24.0
+
+_TIME_TAGS = ("DateTimeOriginal", "DateTimeDigitized", "DateTime")
+
+
+# ---------------------------
+# EXIF parsing
+# ---------------------------
+
+def _number(value):
+    """EXIF rational in any form we store it: IFDRational, (num, den), '37.5', '1/3'."""
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        den = float(value[1])
+        return float(value[0]) / den if den else None
+    if isinstance(value, str):
+        num, sep, den = value.partition("/")
+        if sep:
+            return float(num) / float(den) if float(den) else None
+        return float(value)
+    return float(value)
+
+
+def _degrees(value):
+    try:
+        if isinstance(value, (list, tuple)) and len(value) == 3:
+            d, m, s = (_number(v) for v in value)
+            return d + m / 60.0 + s / 3600.0
+        return _number(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def gps_coordinates(gps):
+    """(lat, lon) in decimal degrees from a GPSInfo dict, or None."""
+    if not gps or "GPSLatitude" not in gps or "GPSLongitude" not in gps:
+        return None
+    lat, lon = _degrees(gps["GPSLatitude"]), _degrees(gps["GPSLongitude"])
+    if lat is None or lon is None:
+        return None
+    if str(gps.get("GPSLatitudeRef", "N")).upper().startswith("S"):
+        lat = -lat
+    if str(gps.get("GPSLongitudeRef", "E")).upper().startswith("W"):
+        lon = -lon
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None
+    return lat, lon
+
+
+def exif_timestamp(exif):
+    """
+    Capture time as a POSIX timestamp, or None.
+    OffsetTimeOriginal is applied when present; without it the camera clock
+    is taken as UTC, which keeps ordering within one device consistent.
+    """
+    for tag in _TIME_TAGS:
+        raw = exif.get(tag)
+        if not raw:
+            continue
+        try:
+            moment = datetime.strptime(str(raw).strip()[:19], "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            continue
+        tz = timezone.utc
+        offset = exif.get("OffsetTimeOriginal") or exif.get("OffsetTime")
+        if offset and len(str(offset)) >= 6:
+            sign = -1 if str(offset)[0] == "-" else 1
+            hours, minutes = str(offset)[1:3], str(offset)[4:6]
+            try:
+                tz = timezone(sign * timedelta(hours=int(hours), minutes=int(minutes)))
+            except ValueError:
+                pass
+        stamp = moment.replace(tzinfo=tz).timestamp()
+        subsec = exif.get("SubsecTimeOriginal") or exif.get("SubSecTimeOriginal")
+        if subsec and str(subsec).strip().isdigit():
+            stamp += float("0." + str(subsec).strip())
+        return stamp
+    return None
+
+
+def device_name(exif):
+    parts = [str(exif.get(tag, "")).strip(" \x00") for tag in ("Make", "Model")]
+    serial = exif.get("BodySerialNumber") or exif.get("SerialNumber")
+    if serial:
+        parts.append(f"#{serial}")
+    return " ".join(p for p in parts if p) or "unknown device"
+
+
+# ---------------------------
+# Reconstruction (vectorized)
+# ---------------------------
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works elementwise on NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64))
+                              for a in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2.0) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2)
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def reconstruct(keys, times, lats, lons, max_speed=MAX_SPEED_KMH, gap_hours=GAP_HOURS):
+    """
+    Order one device's photos by capture time and compute the leg between
+    each consecutive pair (distance, elapsed time, speed) in one pass over
+    the arrays. Anomalies:
+      impossible_speed - a leg faster than `max_speed`
+      outlier_point    - a photo that is impossible to reach and to leave
+                         while its neighbours connect fine (bad GPS fix or
+                         clock); reported instead of its two legs
+      same_time        - same timestamp, different places
+      time_gap         - more than `gap_hours` without photos
+    """
+    times = np.asarray(times, dtype=np.float64)
+    order = np.argsort(times, kind="stable")
+    times = times[order]
+    lats = np.asarray(lats, dtype=np.float64)[order]
+    lons = np.asarray(lons, dtype=np.float64)[order]
+    keys = [keys[i] for i in order]
+    n = len(times)
+
+    dist = haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    dt = np.diff(times)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(dt > 0, dist / (dt / 3600.0), np.where(dist > SAME_TIME_KM, np.inf, 0.0))
+    too_fast = speed > max_speed
+
+    # Point i (interior) is an outlier when both of its legs are impossible
+    # but skipping it gives a plausible leg i-1 -> i+1
+    outlier = np.zeros(n, dtype=bool)
+    bridge_dist = bridge_speed = np.zeros(0)
+    if n >= 3:
+        skip_dist = haversine_km(lats[:-2], lons[:-2], lats[2:], lons[2:])
+        skip_dt = times[2:] - times[:-2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            skip_speed = np.where(skip_dt > 0, skip_dist / (skip_dt / 3600.0), np.inf)
+        outlier[1:-1] = too_fast[:-1] & too_fast[1:] & (skip_speed <= max_speed)
+        # The route goes i-1 -> i+1 around a lone outlier: count that leg
+        # instead of the two dropped ones
+        bridged = outlier[1:-1] & ~outlier[:-2] & ~outlier[2:]
+        bridge_dist, bridge_speed = skip_dist[bridged], skip_speed[bridged]
+    explained = outlier[:-1] | outlier[1:]  # legs touching an outlier
+
+    def _iso(t):
+        return datetime.fromtimestamp(float(t), tz=timezone.utc).isoformat()
+
+    anomalies = []
+    for i in np.nonzero(outlier)[0]:
+        anomalies.append({"type": "outlier_point", "key": keys[i], "time": _iso(times[i]),
+                          "latitude": float(lats[i]), "longitude": float(lons[i])})
+    for i in np.nonzero(too_fast & ~explained)[0]:
+        kind = "same_time" if dt[i] <= 0 else "impossible_speed"
+        anomalies.append({
+            "type": kind, "from": keys[i], "to": keys[i + 1], "time": _iso(times[i + 1]),
+            "distance_km": round(float(dist[i]), 3), "seconds": float(dt[i]),
+            "speed_kmh": None if not np.isfinite(speed[i]) else round(float(speed[i]), 1)})
+    for i in np.nonzero(dt > gap_hours * 3600.0)[0]:
+        anomalies.append({"type": "time_gap", "from": keys[i], "to": keys[i + 1],
+                          "time": _iso(times[i + 1]), "hours": round(float(dt[i]) / 3600.0, 2),
+                          "distance_km": round(float(dist[i]), 3)})
+    anomalies.sort(key=lambda a: a["time"])
+
+    points = []
+    for i in range(n):
+        point = {"key": keys[i], "time": _iso(times[i]),
+                 "latitude": float(lats[i]), "longitude": float(lons[i])}
+        if i:
+            point["distance_km"] = round(float(dist[i - 1]), 3)
+            point["seconds"] = float(dt[i - 1])
+            point["speed_kmh"] = (round(float(speed[i - 1]), 1)
+                                  if np.isfinite(speed[i - 1]) else None)
+        if outlier[i]:
+            point["outlier"] = True
+        points.append(point)
+
+    plausible = ~(too_fast | explained)
+    plausible_speeds = np.concatenate([speed[plausible], bridge_speed])
+    return {
+        "points": points,
+        "anomalies": anomalies,
+        "stats": {
+            "photos": n,
+            "start": _iso(times[0]) if n else None,
+            "end": _iso(times[-1]) if n else None,
+            "distance_km": round(float(dist[plausible].sum() + bridge_dist.sum()), 3),
+            "max_plausible_speed_kmh": (round(float(plausible_speeds.max()), 1)
+                                        if len(plausible_speeds) else 0.0),
+        },
+    }
+
+
+def build_trajectories(results, max_speed=MAX_SPEED_KMH, gap_hours=GAP_HOURS):
+    """
+    Trajectories per device from (key, result dict) pairs.
+    Photos without a capture time or GPS fix are counted, not placed.
+    """
+    groups = {}
+    missing = {"no_time": 0, "no_gps": 0}
+    for key, data in results:
+        meta = data.get("metadata") or {}
+        exif = meta.get("exif") or {}
+        stamp = exif_timestamp(exif)
+        coords = gps_coordinates(data.get("gps") or meta.get("gps"))
+        if stamp is None:
+            missing["no_time"] += 1
+            continue
+        if coords is None:
+            missing["no_gps"] += 1
+            continue
+        group = groups.setdefault(device_name(exif), ([], [], [], []))
+        group[0].append(key)
+        group[1].append(stamp)
+        group[2].append(coords[0])
+        group[3].append(coords[1])
+
+    devices = {name: reconstruct(*cols, max_speed=max_speed, gap_hours=gap_hours)
+               for name, cols in groups.items()}
+    return {"devices": devices, "skipped": missing,
+            "anomaly_count": sum(len(t["anomalies"]) for t in devices.values())}
+
+
+def iter_results(results_dir):
+    """(key, result) for every batch result JSON in a directory."""
+    for path in sorted(glob.glob(os.path.join(results_dir, "*.json"))):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        key = data.get("image_path") or data.get("member_path") or os.path.basename(path)
+        if data.get("archive_path") and data.get("member_path"):
+            key = f"{data['archive_path']}!{data['member_path']}"
+        yield key, data
+
+# ---------------------------
+# Map layer
+# ---------------------------
+
+
+_PALETTE = ["blue", "green", "purple", "orange", "darkblue", "cadetblue", "darkgreen"]
+
+
+def trajectory_layer(name, trajectory, color="blue"):
+    """folium FeatureGroup with the path, photo markers and anomalies in red."""
+    import folium
+
+    layer = folium.FeatureGroup(name=f"Trajectory: {name}")
+    points = trajectory["points"]
+    outliers = {p["key"] for p in points if p.get("outlier")}
+    path = [(p["latitude"], p["longitude"]) for p in points if p["key"] not in outliers]
+    if len(path) >= 2:
+        folium.PolyLine(path, color=color, weight=3, opacity=0.8).add_to(layer)
+    # Time gaps are context, not errors: only movement anomalies are red
+    flagged = {a["to"] for a in trajectory["anomalies"]
+               if a["type"] in ("impossible_speed", "same_time")} | outliers
+    for p in points:
+        bad = p["key"] in flagged
+        folium.CircleMarker(
+            (p["latitude"], p["longitude"]), radius=6 if bad else 4,
+            color="red" if bad else color, fill=True,
+            popup=f"{os.path.basename(str(p['key']))}<br>{p['time']}"
+                  + (f"<br>{p['speed_kmh']} km/h" if p.get("speed_kmh") is not None else ""),
+        ).add_to(layer)
+    return layer
+
+
+def save_trajectory_map(report, path=DEFAULT_TRAJECTORY_MAP):
+    import folium
+
+    coords = [(p["latitude"], p["longitude"])
+              for t in report["devices"].values() for p in t["points"]]
+    if not coords:
+        return None
+    fmap = folium.Map(location=coords[0], zoom_start=6)
+    for i, (name, traj) in enumerate(report["devices"].items()):
+        trajectory_layer(name, traj, _PALETTE[i % len(_PALETTE)]).add_to(fmap)
+    folium.LayerControl().add_to(fmap)
+    fmap.fit_bounds([[min(c[0] for c in coords), min(c[1] for c in coords)],
+                     [max(c[0] for c in coords), max(c[1] for c in coords)]])
+    fmap.save(path)
+    return path
+
+
+def write_report(report, out_path=DEFAULT_TRAJECTORY_FILE, map_path=DEFAULT_TRAJECTORY_MAP):
+    """Save the JSON report and map; print a summary with the anomalies."""
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=4)
+    saved_map = save_trajectory_map(report, map_path) if map_path else None
+
+    print("\n========================================================")
+    print("🧭 TRAJECTORY")
+    print("========================================================")
+    for name, traj in report["devices"].items():
+        stats = traj["stats"]
+        print(f"📷 {name}: {stats['photos']} photo(s), {stats['distance_km']} km, "
+              f"{stats['start']} → {stats['end']}")
+        for anomaly in traj["anomalies"][:20]:
+            if anomaly["type"] == "outlier_point":
+                print(f"   ⚠️ outlier point: {anomaly['key']} ({anomaly['time']})")
+            elif anomaly["type"] == "time_gap":
+                print(f"   ⏸️ gap of {anomaly['hours']} h before {anomaly['to']}")
+            else:
+                speed = anomaly["speed_kmh"]
+                print(f"   ⚠️ {anomaly['type']}: {anomaly['from']} → {anomaly['to']} "
+                      f"({anomaly['distance_km']} km"
+                      + (f", {speed} km/h)" if speed is not None else ")"))
+    skipped = report["skipped"]
+    print(f"⏭️ Not placed: {skipped['no_time']} without capture time, "
+          f"{skipped['no_gps']} without GPS")
+    print(f"📄 Report: {os.path.abspath(out_path)}")
+    if saved_map:
+        print(f"🗺️ Map: {os.path.abspath(saved_map)}")
+    print("========================================================\n")
+    return report
+
+# ---------------------------
+# `main.py trajectory` subcommand
+# ---------------------------
+
+
+def trajectory_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="main.py trajectory",
+        description="Reconstruct movement from the EXIF time and GPS of batch results")
+    parser.add_argument('--results-dir', type=str, default="imgmapon_results",
+                        help="Batch results directory (run the batch with --metadata)")
+    parser.add_argument('--max-speed', type=float, default=MAX_SPEED_KMH,
+                        help="Speed in km/h above which a leg is impossible")
+    parser.add_argument('--gap-hours', type=float, default=GAP_HOURS,
+                        help="Report gaps longer than this between photos")
+    parser.add_argument('--out', type=str, default=DEFAULT_TRAJECTORY_FILE,
+                        help="JSON report path")
+    parser.add_argument('--map', type=str, default=DEFAULT_TRAJECTORY_MAP,
+                        help="Map HTML path ('' to skip)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.results_dir):
+        print(f"❌ Results directory not found: {args.results_dir}")
+        return None
+    report = build_trajectories(iter_results(args.results_dir),
+                                max_speed=args.max_speed, gap_hours=args.gap_hours)
+    return write_report(report, args.out, args.map or None)
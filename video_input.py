@@ -0,0 +1,186 @@
+# video_input.py
+# IMG MAPON - Video decoding & scene-change keyframe sampling
+# Author: ICITIFY TECH
+
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+# Histogram size used for the scene-change signature (hue x saturation)
+HIST_BINS = [16, 8]
+# Frames are shrunk to this width before hashing; the metric only needs coarse colour
+SIGNATURE_WIDTH = 160
+
+# ---------------------------
+# Container metadata
+# ---------------------------
+
+
+def _parse_iso6709(value):
+    """
+    Parse an ISO 6709 location string as written by phones into MP4/MOV
+    containers (e.g. "+37.7749-122.4194+010.000/").
+    Returns (lat, lon) or None.
+    """
+    if not value:
+        return None
+    m = re.match(r'^([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)', str(value).strip())
+    if not m:
+        return None
+    try:
+        return float(m.group(1)), float(m.group(2))
+    except ValueError:
+        return None
+
+
+def _ffprobe_tags(video_path, timeout=15):
+    """Best-effort container tags via ffprobe (creation time, device, location)."""
+    if not shutil.which("ffprobe"):
+        return {}
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "quiet", "-print_format", "json",
+             "-show_format", video_path],
+            capture_output=True, text=True, timeout=timeout
+        )
+        fmt = json.loads(result.stdout or "{}").get("format", {})
+    except Exception:
+        return {}
+
+    tags = {k.lower(): v for k, v in (fmt.get("tags") or {}).items()}
+    info = {
+        "format_name": fmt.get("format_name"),
+        "bit_rate": fmt.get("bit_rate"),
+        "tags": tags,
+    }
+    location = tags.get("location") or tags.get("com.apple.quicktime.location.iso6709") \
+        or tags.get("location-eng")
+    coords = _parse_iso6709(location)
+    if coords:
+        info["location"] = {"latitude": coords[0], "longitude": coords[1]}
+    return info
+
+
+def video_metadata(video_path):
+    """
+    Return container/stream metadata for a video file.
+    OpenCV supplies the stream properties; ffprobe (if installed) adds the
+    container tags phones write, such as creation_time and GPS location.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return {"error": f"Could not open video: {video_path}"}
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC) or 0)
+        codec = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00")
+        info = {
+            "container": os.path.splitext(video_path)[1].lstrip(".").lower() or None,
+            "codec": codec or None,
+            "fps": float(fps),
+            "frame_count": frame_count,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0),
+            "duration": round(frame_count / fps, 3) if fps else None,
+            "file_size": os.path.getsize(video_path),
+        }
+    finally:
+        cap.release()
+
+    probe = _ffprobe_tags(video_path)
+    if probe:
+        info["ffprobe"] = probe
+    return info
+
+# ---------------------------
+# Scene-change keyframe sampling
+# ---------------------------
+
+
+def _frame_signature(frame):
+    """Normalized hue/saturation histogram of a downscaled frame."""
+    h, w = frame.shape[:2]
+    if w > SIGNATURE_WIDTH:
+        scale = SIGNATURE_WIDTH / float(w)
+        frame = cv2.resize(frame, (SIGNATURE_WIDTH, max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, HIST_BINS, [0, 180, 0, 256])
+    cv2.normalize(hist, hist, alpha=1.0, norm_type=cv2.NORM_L1)
+    return hist
+
+
+def scene_distance(sig_a, sig_b):
+    """Bhattacharyya distance between two signatures (0 = identical, 1 = disjoint)."""
+    return float(cv2.compareHist(sig_a, sig_b, cv2.HISTCMP_BHATTACHARYYA))
+
+
+def iter_keyframes(video_path, threshold=0.35, min_gap=1.0, sample_interval=0.2,
+                   max_frames=None):
+    """
+    Stream a video and yield keyframes as (frame_index, timestamp_sec, frame_bgr, score).
+
+    - Frames are decoded sequentially; only one frame is held in memory.
+    - A frame is inspected every `sample_interval` seconds (others are only
+      grabbed, never converted) and compared against the last keyframe.
+    - A new keyframe is emitted when the histogram distance exceeds
+      `threshold` and at least `min_gap` seconds passed since the last one.
+    - The first readable frame is always a keyframe.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    if fps <= 0 or np.isnan(fps):
+        fps = 30.0  # sensible default for phone footage with missing headers
+    step = max(1, int(round(sample_interval * fps)))
+
+    last_sig = None
+    last_ts = None
+    emitted = 0
+    index = -1
+    try:
+        while True:
+            if not cap.grab():
+                break
+            index += 1
+            if index % step:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok or frame is None:
+                continue
+
+            pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            timestamp = pos_ms / 1000.0 if pos_ms and pos_ms > 0 else index / fps
+
+            sig = _frame_signature(frame)
+            if last_sig is None:
+                score = 1.0
+            else:
+                if timestamp - last_ts < min_gap:
+                    continue
+                score = scene_distance(last_sig, sig)
+                if score < threshold:
+                    continue
+
+            last_sig, last_ts = sig, timestamp
+            emitted += 1
+            yield index, round(timestamp, 3), frame, round(score, 4)
+
+            if max_frames and emitted >= max_frames:
+                break
+    finally:
+        cap.release()
+
+
+def save_frame(frame, path, quality=95):
+    """Write a decoded frame to disk as JPEG so path-based analyzers can read it."""
+    cv2.imwrite(path, frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return path
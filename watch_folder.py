@@ -0,0 +1,202 @@
+# watch_folder.py
+# IMG MAPON - Watch a drop folder and analyze new / changed images
+# Author: ICITIFY TECH
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+
+from batch import IMAGE_EXTENSIONS
+
+# inotify event bits (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def scan(directory):
+    """{path: (size, mtime_ns)} for every image under directory."""
+    found = {}
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            if not _is_image(name):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found[path] = (st.st_size, st.st_mtime_ns)
+    return found
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+
+class Inotify:
+    """Minimal recursive inotify watcher (Linux, via libc); no extra dependency."""
+
+    def __init__(self, directory):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        for root, _dirs, _files in os.walk(directory):
+            self._add(root)
+
+    def _add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = path
+
+    def close(self):
+        os.close(self.fd)
+
+    def wait(self, timeout):
+        """
+        Block up to `timeout` seconds; return (changed image paths, overflowed).
+        A queue overflow means events were lost and the caller should rescan.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set(), False
+        changed, overflow = set(), False
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed, overflow
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, pos)
+            name = buf[pos + _EVENT_HEADER.size:pos + _EVENT_HEADER.size + length]
+            pos += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            parent = self.dirs.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, os.fsdecode(name.rstrip(b"\0")))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for root, _dirs, _files in os.walk(path):
+                        self._add(root)
+                    overflow = True  # files may already be inside: rescan
+            elif _is_image(path):
+                changed.add(path)
+        return changed, overflow
+
+
+def load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return {path: tuple(sig) for path, sig in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_path, state):
+    tmp = state_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+
+def watch(directory, process_func, state_path, settle=2.0, poll_interval=5.0,
+          use_inotify=True, stop_after=None):
+    """
+    Call `process_func(path)` for every image that is new or changed since
+    the last run, then keep watching.
+
+    - Files are debounced: an image is processed only once its size and
+      mtime have been unchanged for `settle` seconds (partially written or
+      still-copying files are left alone).
+    - inotify wakes the loop on changes; without it the folder is rescanned
+      every `poll_interval` seconds.
+    - The state file maps path -> (size, mtime) of processed images, so a
+      restart only picks up what changed while it was down.
+    `stop_after` (seconds) ends the loop, for scripted runs.
+    """
+    state = load_state(state_path)
+    # Drop entries for files that no longer exist
+    state = {p: sig for p, sig in state.items() if os.path.exists(p)}
+
+    notifier = None
+    if use_inotify:
+        try:
+            notifier = Inotify(directory)
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify unavailable ({e}); polling every {poll_interval}s.")
+    mode = "inotify" if notifier else "polling"
+    print(f"👀 Watching {directory} ({mode}, settle {settle}s). Press Ctrl+C to stop.")
+
+    pending = {}  # path -> (signature, time first seen with that signature)
+
+    def _consider(paths):
+        now = time.monotonic()
+        for path in paths:
+            sig = _signature(path)
+            if sig is None:
+                pending.pop(path, None)
+            elif state.get(path) != sig and (path not in pending or pending[path][0] != sig):
+                pending[path] = (sig, now)
+
+    _consider(scan(directory).keys())
+    started = time.monotonic()
+    processed = 0
+    try:
+        while stop_after is None or time.monotonic() - started < stop_after:
+            # Process files that have settled
+            now = time.monotonic()
+            for path, (sig, since) in sorted(pending.items()):
+                if now - since < settle:
+                    continue
+                current = _signature(path)
+                if current != sig:
+                    _consider([path])  # still being written: restart the clock
+                    continue
+                del pending[path]
+                try:
+                    process_func(path)
+                    processed += 1
+                except Exception as e:
+                    print(f"❌ {path}: {type(e).__name__}: {e}")
+                # Failed files are recorded too: they are retried once they change
+                state[path] = sig
+                save_state(state_path, state)
+
+            timeout = settle if pending else poll_interval
+            if notifier:
+                changed, overflow = notifier.wait(timeout)
+                _consider(scan(directory).keys() if overflow else changed)
+            else:
+                time.sleep(timeout)
+                _consider(scan(directory).keys())
+    except KeyboardInterrupt:
+        print("\n🛑 Watch stopped.")
+    finally:
+        if notifier:
+            notifier.close()
+    return processed